@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidate_promo
+from .conditional import bump_user
+from .events import activation_log
+from .models import ActivationEvent, Promo, PromoActivation, PromoCode
+
+
+class ActivationError(Exception):
+    pass
+
+
+class PromoExhausted(ActivationError):
+    pass
+
+
+def claim_common(promo, user_id):
+    claimed = Promo.objects.filter(id_promo=promo.id_promo, active=True, max_count__gt=0).update(
+        max_count=F('max_count') - 1,
+    )
+    if not claimed:
+        raise PromoExhausted()
+    return promo.promo_common
+
+
+def claim_unique(promo, user_id):
+    claimed = (PromoCode.objects
+               .select_for_update(skip_locked=True, of=('self',))
+               .filter(promo_id=promo.id_promo, promo__active=True, claimed_at__isnull=True)
+               .order_by('id')
+               .only('id', 'code')
+               .first())
+    if claimed is None:
+        raise PromoExhausted()
+    PromoCode.objects.filter(id=claimed.id).update(claimed_by_id=user_id, claimed_at=timezone.now())
+    return claimed.code
+
+
+def record_activation(promo, user_id):
+    PromoActivation.objects.create(user_id=user_id, promo_id=promo.id_promo)
+
+
+def activate_promo(promo, user_id, country=None):
+    mode = promo.mode.upper()
+    if mode == "COMMON":
+        claim = claim_common
+    elif mode == "UNIQUE":
+        claim = claim_unique
+    else:
+        raise ActivationError()
+    with transaction.atomic():
+        code = claim(promo, user_id)
+        record_activation(promo, user_id)
+        invalidate_promo(promo.id_promo, feed=False)
+        bump_user(user_id)
+        event = ActivationEvent(promo_id=promo.id_promo, user_id=user_id, code=code,
+                                country=(country or '').lower())
+        transaction.on_commit(lambda: activation_log.add(event), robust=True)
+    return code
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class ApiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api_app'
+
+    def ready(self):
+        from .routers import check_pin_cache
+        from .search import install_sqlite_fts
+        post_migrate.connect(install_sqlite_fts, sender=self)
+        checks.register(check_pin_cache, checks.Tags.caches)
@@ -0,0 +1,88 @@
+import uuid
+
+from .cache import invalidate_promos
+from .codes import replace_free_codes
+from .models import Promo, PromoCode
+from .ranking import sync_ranks
+from .serializers import PromoSerializer
+
+BULK_BATCH_SIZE = 1000
+
+
+def parse_ids(values):
+    ids = []
+    for value in values:
+        try:
+            ids.append(uuid.UUID(str(value)))
+        except ValueError:
+            continue
+    return ids
+
+
+def create_promos(company_id, items):
+    results, promos, codes = [], [], []
+    for index, item in enumerate(items):
+        serializer = PromoSerializer(data=item)
+        if not serializer.is_valid():
+            results.append({"index": index, "errors": serializer.errors})
+            continue
+        data = dict(serializer.validated_data, company_id=company_id)
+        promo_unique = data.pop('promo_unique', [])
+        promo = serializer.build_instance(data)
+        promos.append(promo)
+        codes.extend(PromoCode(promo=promo, code=code) for code in dict.fromkeys(promo_unique))
+        results.append({"index": index, "id": promo.id_promo})
+    Promo.objects.bulk_create(promos, batch_size=BULK_BATCH_SIZE)
+    PromoCode.objects.bulk_create(codes, batch_size=BULK_BATCH_SIZE * 5)
+    sync_ranks(promos, created=True)
+    invalidate_promos([promo.id_promo for promo in promos])
+    return results
+
+
+def update_promos(company_id, items):
+    ids = parse_ids(item.get('id') for item in items if isinstance(item, dict))
+    existing = Promo.objects.filter(company_id=company_id).in_bulk(ids)
+    # Promos are written grouped by the exact columns their item set, never the union across the batch.
+    results, promos, groups, codes, retargeted = [], [], {}, [], []
+    for index, item in enumerate(items):
+        item_ids = parse_ids([item.get('id')]) if isinstance(item, dict) else []
+        promo = existing.get(item_ids[0]) if item_ids else None
+        if promo is None:
+            results.append({"index": index, "errors": {"id": ["Promo not found."]}})
+            continue
+        serializer = PromoSerializer(promo, data={k: v for k, v in item.items() if k != 'id'}, partial=True)
+        if not serializer.is_valid():
+            results.append({"index": index, "errors": serializer.errors})
+            continue
+        data = dict(serializer.validated_data)
+        promo_unique, fields = serializer.apply_update(promo, data)
+        if fields:
+            groups.setdefault(tuple(fields), []).append(promo)
+        if 'target' in data:
+            retargeted.append(promo)
+        if promo_unique is not None:
+            codes.append((promo, promo_unique))
+        promos.append(promo)
+        results.append({"index": index, "id": promo.id_promo})
+    for fields, group in groups.items():
+        Promo.objects.bulk_update(group, fields, batch_size=BULK_BATCH_SIZE)
+    sync_ranks(retargeted)
+    for promo, promo_unique in codes:
+        replace_free_codes(promo, promo_unique)
+    invalidate_promos([promo.id_promo for promo in promos])
+    return results
+
+
+def set_active(company_id, values, active):
+    owned = Promo.objects.filter(company_id=company_id, id_promo__in=parse_ids(values))
+    updated = set(owned.values_list('id_promo', flat=True))
+    owned.filter(id_promo__in=updated).update(active=active)
+    invalidate_promos(updated)
+    results = []
+    for index, value in enumerate(values):
+        value_ids = parse_ids([value])
+        if value_ids and value_ids[0] in updated:
+            results.append({"index": index, "id": value_ids[0]})
+        else:
+            results.append({"index": index, "errors": {"id": ["Promo not found."]}})
+    return results
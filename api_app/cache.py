@@ -0,0 +1,76 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .conditional import bump_promos
+from .models import User
+from .routers import reads_from_primary
+
+PROMO_CACHE_KINDS = ('user', 'company', 'stat')
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _key(kind, id_promo):
+    return f'promo:{kind}:{id_promo}'
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def cached_promo(kind, id_promo, build):
+    key = _key(kind, id_promo)
+    data = cache.get(key)
+    if data is not None:
+        _record('hits')
+        return data, True
+    _record('misses')
+    # Built from the primary: a lagging replica row would be cached for everyone.
+    with reads_from_primary():
+        data = build()
+    if data is not None:
+        cache.set(key, data, getattr(settings, 'PROMO_CACHE_TIMEOUT', 300))
+    return data, False
+
+
+def invalidate_promo(id_promo, feed=True):
+    invalidate_promos([id_promo], feed)
+
+
+def invalidate_promos(ids, feed=True):
+    # feed=False for writes that only move counters: the feed shows them eventually, see FEED_MAX_AGE.
+    keys = [_key(kind, id_promo) for id_promo in ids for kind in PROMO_CACHE_KINDS]
+    cache.delete_many(keys)
+    bump_promos(ids, feed)
+    # A concurrent reader may repopulate the old row before we commit.
+    transaction.on_commit(lambda: (cache.delete_many(keys), bump_promos(ids, feed)))
+
+
+def _profile_key(user_id):
+    return f'profile:{user_id}'
+
+
+def cached_profile(user_id):
+    key = _profile_key(user_id)
+    profile = cache.get(key)
+    if profile is None:
+        with reads_from_primary():
+            profile = User.objects.filter(id=user_id).values_list('other', flat=True).first() or {}
+        cache.set(key, profile, getattr(settings, 'PROMO_CACHE_TIMEOUT', 300))
+    return profile
+
+
+def invalidate_profile(user_id):
+    key = _profile_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
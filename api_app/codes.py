@@ -0,0 +1,133 @@
+import codecs
+import csv
+import json
+import secrets
+import string
+from itertools import chain, islice
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import PromoCode
+
+IMPORT_CHUNK_SIZE = 5000
+CODE_MAX_LENGTH = 200
+GENERATED_CODE_ALPHABET = string.ascii_uppercase + string.digits
+GENERATED_CODE_LENGTH = 12
+
+
+class CodeImportError(Exception):
+    pass
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _clean(code):
+    code = code.strip()
+    if not code:
+        return None
+    if len(code) > CODE_MAX_LENGTH:
+        raise CodeImportError(f"Code is longer than {CODE_MAX_LENGTH} characters: {code[:20]}...")
+    return code
+
+
+def parse_csv(lines):
+    for row in csv.reader(lines):
+        if row and (code := _clean(row[0])):
+            yield code
+
+
+def parse_ndjson(lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise CodeImportError(f"Invalid JSON on line {number}: {line[:40]}")
+        if isinstance(item, dict):
+            item = item.get('code', '')
+        if not isinstance(item, str):
+            raise CodeImportError(f"Line {number} must be a string or an object with a string 'code'.")
+        if code := _clean(item):
+            yield code
+
+
+def decode_lines(chunks):
+    # codecs.iterdecode would raise a bare UnicodeDecodeError; report the line instead.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    line = 1
+    for chunk in chain(chunks, [None]):
+        try:
+            text = decoder.decode(b'', final=True) if chunk is None else decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            line += e.object[:e.start].count(b'\n')
+            raise CodeImportError(f"Line {line} is not valid UTF-8.")
+        line += text.count('\n')
+        if text:
+            yield text
+
+
+def parse_stream(stream, content_type):
+    lines = decode_lines(stream)
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        return parse_ndjson(lines)
+    return parse_csv(lines)
+
+
+def _insert_new(promo, codes):
+    existing = set(PromoCode.objects.filter(promo=promo, code__in=codes).values_list('code', flat=True))
+    new_codes = [code for code in dict.fromkeys(codes) if code not in existing]
+    PromoCode.objects.bulk_create([PromoCode(promo=promo, code=code) for code in new_codes],
+                                  ignore_conflicts=True)
+    return len(new_codes)
+
+
+def add_codes(promo, codes):
+    added = 0
+    with transaction.atomic():
+        for chunk in _chunks(codes, IMPORT_CHUNK_SIZE):
+            added += _insert_new(promo, chunk)
+    return added
+
+
+def replace_free_codes(promo, codes):
+    with transaction.atomic():
+        PromoCode.objects.filter(promo=promo, claimed_at__isnull=True).delete()
+        add_codes(promo, codes)
+
+
+def generate_codes(promo, count, length=GENERATED_CODE_LENGTH):
+    generated = 0
+    with transaction.atomic():
+        while generated < count:
+            batch = set()
+            while len(batch) < min(count - generated, IMPORT_CHUNK_SIZE):
+                batch.add(''.join(secrets.choice(GENERATED_CODE_ALPHABET) for _ in range(length)))
+            generated += _insert_new(promo, list(batch))
+    return generated
+
+
+def free_codes(promo):
+    return list(PromoCode.objects.filter(promo=promo, claimed_at__isnull=True)
+                .order_by('id').values_list('code', flat=True))
+
+
+def _code_count(**filters):
+    return Coalesce(Subquery(
+        PromoCode.objects.filter(promo=OuterRef('pk'), **filters)
+        .order_by().values('promo').annotate(total=Count('id')).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def with_pool_counts(queryset):
+    return queryset.annotate(
+        promo_unique_total=_code_count(),
+        promo_unique_available=_code_count(claimed_at__isnull=True),
+    )
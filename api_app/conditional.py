@@ -0,0 +1,67 @@
+import functools
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+FEED_SCOPE = ('feed', 'all')
+
+
+# Versions live in the default cache, so every worker must share it (settings_prod uses Redis).
+# A version that is missing or evicted is recreated as "now": that costs a 200, never a stale 304.
+def _key(scope, ident):
+    return f'version:{scope}:{ident}'
+
+
+def get_versions(*scopes):
+    keys = [_key(scope, ident) for scope, ident in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def bump_versions(*scopes):
+    now = time.time_ns()
+    cache.set_many({_key(scope, ident): now for scope, ident in scopes}, None)
+
+
+def bump_promos(ids, feed=True):
+    scopes = [('promo', id_promo) for id_promo in ids]
+    if feed:
+        scopes.append(FEED_SCOPE)
+    bump_versions(*scopes)
+
+
+def bump_user(user_id):
+    bump_versions(('user', user_id))
+
+
+def conditional(scopes_func, max_age=None):
+    # max_age() -> seconds: validators also expire on that period, for data that changes without a bump.
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            scopes = scopes_func(request, *args, **kwargs)
+            versions = get_versions(*scopes)
+            period = max_age() if max_age else None
+            if period:
+                versions.append(int(time.time() // period * period) * 1_000_000_000)
+            digest = hashlib.md5(repr((scopes, versions, request.get_full_path())).encode()).hexdigest()
+            etag = quote_etag(digest)
+            last_modified = max(versions) // 1_000_000_000
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response.headers.setdefault('ETag', etag)
+                response.headers.setdefault('Last-Modified', http_date(last_modified))
+            return response
+        return wrapper
+    return decorator
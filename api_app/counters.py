@@ -0,0 +1,117 @@
+import random
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Promo, PromoCounterShard, PromoDailyStat
+from .ranking import LIKE_WEIGHT, bump_ranks
+
+# shard field -> Promo column it is folded into
+COUNTERS = (('likes', 'like_count'), ('comments', 'comment_count'))
+
+
+def bump(model, lookup, **deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    rows = model.objects.filter(**lookup)
+    # A fold can delete the row between the insert and the update, so retry until an update lands.
+    while not rows.update(**updates):
+        model.objects.bulk_create([model(**lookup)], ignore_conflicts=True)
+
+
+def add_counts(promo_id, **deltas):
+    # Writers pick a random shard row, so a hot promo is spread over COUNTER_SHARDS row locks
+    # instead of serialising on the promo row; the folder moves the deltas onto the promo later.
+    shard = random.randrange(getattr(settings, 'COUNTER_SHARDS', 8))
+    bump(PromoCounterShard, {'promo_id': promo_id, 'day': timezone.localdate(), 'shard': shard}, **deltas)
+    transaction.on_commit(counter_folder.schedule)
+
+
+def _pending(field):
+    return Coalesce(Subquery(
+        PromoCounterShard.objects.filter(promo=OuterRef('pk'))
+        .order_by().values('promo').annotate(total=Sum(field)).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def with_counters(queryset):
+    return queryset.annotate(
+        like_total=F('like_count') + _pending('likes'),
+        comment_total=F('comment_count') + _pending('comments'),
+    )
+
+
+def pending_counts(promo_id):
+    totals = PromoCounterShard.objects.filter(promo_id=promo_id).aggregate(
+        likes=Sum('likes'), comments=Sum('comments'))
+    return {field: total or 0 for field, total in totals.items()}
+
+
+def pending_daily_counts(promo_id):
+    rows = (PromoCounterShard.objects.filter(promo_id=promo_id).order_by().values('day')
+            .annotate(likes=Sum('likes'), comments=Sum('comments')).values_list('day', 'likes', 'comments'))
+    return {day: {"likes": likes, "comments": comments} for day, likes, comments in rows}
+
+
+def _fold_batch_size():
+    return getattr(settings, 'COUNTER_FOLD_BATCH_SIZE', 5000)
+
+
+def fold(batch_size=None):
+    batch_size = batch_size or _fold_batch_size()
+    with transaction.atomic():
+        # Shards a writer is holding right now are left for the next fold instead of waiting on them.
+        shards = list(PromoCounterShard.objects.select_for_update(skip_locked=True).order_by('id')
+                      .values_list('id', 'promo_id', 'day', 'likes', 'comments')[:batch_size])
+        if not shards:
+            return 0
+        PromoCounterShard.objects.filter(id__in=[shard[0] for shard in shards]).delete()
+        per_promo = defaultdict(Counter)
+        per_day = defaultdict(Counter)
+        for _, promo_id, day, likes, comments in shards:
+            for totals in (per_promo[promo_id], per_day[promo_id, day]):
+                totals['likes'] += likes
+                totals['comments'] += comments
+        for (promo_id, day), totals in per_day.items():
+            bump(PromoDailyStat, {'promo_id': promo_id, 'day': day}, **totals)
+        Promo.objects.filter(id_promo__in=per_promo).update(**{
+            column: F(column) + Case(
+                *[When(id_promo=promo_id, then=Value(totals[field])) for promo_id, totals in per_promo.items()],
+                output_field=IntegerField(),
+            )
+            for field, column in COUNTERS
+        })
+        bump_ranks({promo_id: totals['likes'] * LIKE_WEIGHT for promo_id, totals in per_promo.items()})
+    return len(shards)
+
+
+class CounterFolder:
+
+    def __init__(self, interval=None):
+        self.interval = interval or getattr(settings, 'COUNTER_FOLD_INTERVAL', 2.0)
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self._fold_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _fold_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            if fold() >= _fold_batch_size():
+                self.schedule()
+        finally:
+            connections.close_all()
+
+
+counter_folder = CounterFolder()
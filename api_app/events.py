@@ -0,0 +1,128 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connections, transaction
+
+from .cache import invalidate_promos
+from .models import ActivationEvent
+from .stats import record_activations
+
+logger = logging.getLogger(__name__)
+
+
+# Errors caused by the event itself; anything else (a lost connection, a failover) is retried until it clears.
+POISON_ERRORS = (IntegrityError, DataError)
+
+
+class ActivationLogWriter:
+    # Events are written by a background timer, never by the request that produced them:
+    # the activation is already committed, so a failing stats write must not turn it into a 500.
+
+    def __init__(self, batch_size=None, flush_interval=None, max_attempts=None, max_backoff=None):
+        self.batch_size = batch_size or getattr(settings, 'ACTIVATION_LOG_BATCH_SIZE', 500)
+        self.flush_interval = flush_interval or getattr(settings, 'ACTIVATION_LOG_FLUSH_INTERVAL', 2.0)
+        self.max_attempts = max_attempts or getattr(settings, 'ACTIVATION_LOG_MAX_ATTEMPTS', 5)
+        self.max_backoff = max_backoff or getattr(settings, 'ACTIVATION_LOG_MAX_BACKOFF', 60.0)
+        # (event, failed attempts so far)
+        self._buffer = []
+        # Delay before the next flush while the database is unreachable, 0 when it is healthy.
+        self._backoff = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    def add(self, event):
+        with self._lock:
+            self._buffer.append((event, 0))
+            delay = 0 if len(self._buffer) >= self.batch_size else self.flush_interval
+            self._schedule(max(delay, self._backoff))
+
+    def _schedule(self, delay):
+        # Caller holds self._lock. A full buffer brings a pending timer forward to flush right away.
+        if self._timer is not None:
+            if delay >= self._timer.interval:
+                return
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self._flush_from_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _write(self, events):
+        with transaction.atomic():
+            ActivationEvent.objects.bulk_create(events)
+            record_activations(events)
+
+    def _requeue(self, batch, unavailable=False):
+        with self._lock:
+            if unavailable:
+                self._backoff = min(max(self._backoff * 2, self.flush_interval), self.max_backoff)
+            else:
+                self._backoff = 0
+            self._buffer[:0] = batch
+            self._schedule(max(self.flush_interval, self._backoff))
+
+    def _write_each(self, batch):
+        # One bad event must not hold back the rest: write them one by one and requeue the failures.
+        # Only POISON_ERRORS count towards max_attempts, so an outage never drops anything.
+        written, retry = [], []
+        for position, (event, attempts) in enumerate(batch):
+            try:
+                self._write([event])
+            except POISON_ERRORS:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    logger.exception("Dropping activation event for promo %s after %d attempts.",
+                                     event.promo_id, attempts)
+                else:
+                    retry.append((event, attempts))
+            except Exception:
+                logger.exception("Writing activation events failed, keeping %d queued.", len(batch) - position)
+                self._requeue(retry + batch[position:], unavailable=True)
+                return written
+            else:
+                written.append(event)
+        if retry:
+            self._requeue(retry)
+        return written
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not batch:
+                return 0
+            events = [event for event, _ in batch]
+            try:
+                self._write(events)
+            except POISON_ERRORS:
+                logger.exception("Writing %d activation events failed, retrying them one by one.", len(events))
+                events = self._write_each(batch)
+            except Exception:
+                logger.exception("Writing %d activation events failed, keeping them queued.", len(events))
+                self._requeue(batch, unavailable=True)
+                return 0
+            else:
+                with self._lock:
+                    self._backoff = 0
+            if events:
+                invalidate_promos({event.promo_id for event in events}, feed=False)
+            return len(events)
+
+
+activation_log = ActivationLogWriter()
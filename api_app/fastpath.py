@@ -0,0 +1,96 @@
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROMO_OUT_VALUES = (
+    'id_promo', 'company_id', 'company__name', 'description', 'image_url', 'active',
+    'like_total', 'comment_total', 'active_from',
+)
+
+PROMO_FOR_COMPANY_OUT_VALUES = (
+    'description', 'image_url', 'target', 'max_count', 'active_from', 'active_until', 'mode',
+    'promo_common', 'promo_unique_total', 'promo_unique_available', 'id_promo', 'company_id',
+    'company__name', 'like_total', 'used_count', 'active',
+)
+
+
+def values_for(fields, ordering):
+    # The keyset cursor is read from the row, so every ordering column has to be selected too.
+    extra = (field.lstrip('-') for field in ordering)
+    return (*fields, *dict.fromkeys(field for field in extra if field not in fields))
+
+
+def _has_float(value):
+    if isinstance(value, float):
+        return True
+    if isinstance(value, dict):
+        return any(_has_float(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_has_float(item) for item in value)
+    return False
+
+
+def render_json(data, exact_floats=False):
+    # orjson and the stdlib encoder agree byte for byte except for float
+    # exponents, U+2028/U+2029 (escaped by DRF) and lone surrogates.
+    if orjson is not None and not exact_floats:
+        try:
+            content = orjson.dumps(data)
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return JSONRenderer().render(data)
+
+
+def json_response(data, status=200, exact_floats=False):
+    return HttpResponse(render_json(data, exact_floats), status=status, content_type='application/json')
+
+
+def promo_out_rows(rows, flags):
+    liked, activated = flags["liked"], flags["activated"]
+    data = []
+    for row in rows:
+        promo_id = str(row['id_promo'])
+        data.append({
+            "promo_id": promo_id,
+            "company_id": str(row['company_id']),
+            "company_name": row['company__name'],
+            "description": row['description'],
+            "image_url": row['image_url'],
+            "active": row['active'],
+            "is_activated_by_user": promo_id in activated,
+            "like_count": row['like_total'],
+            "is_liked_by_user": promo_id in liked,
+            "comment_count": row['comment_total'],
+        })
+    return data
+
+
+def promo_for_company_out_rows(rows):
+    data, has_float = [], False
+    for row in rows:
+        has_float = has_float or _has_float(row['target'])
+        data.append({
+            "description": row['description'],
+            "image_url": row['image_url'],
+            "target": row['target'],
+            "max_count": row['max_count'],
+            "active_from": row['active_from'].isoformat(),
+            "active_until": row['active_until'].isoformat(),
+            "mode": row['mode'],
+            "promo_common": row['promo_common'],
+            "promo_unique_total": row['promo_unique_total'],
+            "promo_unique_available": row['promo_unique_available'],
+            "promo_id": str(row['id_promo']),
+            "company_id": str(row['company_id']),
+            "company_name": row['company__name'],
+            "like_count": row['like_total'],
+            "used_count": row['used_count'],
+            "active": row['active'],
+        })
+    return data, has_float
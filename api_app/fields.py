@@ -0,0 +1,63 @@
+import json
+
+from django.contrib.postgres.fields import ArrayField as PostgresArrayField
+from django.contrib.postgres.fields.array import ArrayContains as PostgresArrayContains
+from django.contrib.postgres.indexes import GinIndex as PostgresGinIndex
+from django.contrib.postgres.search import SearchVectorField as PostgresSearchVectorField
+from django.db import models
+
+
+class ArrayField(PostgresArrayField):
+    # Stored as a JSON list on backends without native arrays (the SQLite test profile).
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return super().db_type(connection)
+        return 'text'
+
+    def get_placeholder(self, value, compiler, connection):
+        if connection.vendor == 'postgresql':
+            return super().get_placeholder(value, compiler, connection)
+        return '%s'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if connection.vendor == 'postgresql' or value is None:
+            return value
+        return json.dumps(list(value))
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+
+class SearchVectorField(PostgresSearchVectorField):
+    # Left empty on other backends, where an FTS5 table does the indexing (see search.py).
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return super().db_type(connection)
+        return 'text'
+
+
+@ArrayField.register_lookup
+class ArrayContains(PostgresArrayContains):
+
+    def __init__(self, lhs, rhs):
+        self.values = rhs
+        super().__init__(lhs, rhs)
+
+    def as_sqlite(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        sql = (f"NOT EXISTS (SELECT 1 FROM json_each(%s) AS wanted WHERE wanted.value NOT IN "
+               f"(SELECT have.value FROM json_each({lhs}) AS have))")
+        return sql, [json.dumps(list(self.values)), *lhs_params]
+
+
+class GinIndex(PostgresGinIndex):
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+        return models.Index.create_sql(self, model, schema_editor, using=using, **kwargs)
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+    return pick(0.5), pick(0.95), pick(0.99)
+
+
+def simulate_request(connection):
+    close_old_connections()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ("Compares per-request connection setup against the connection handling of the active settings "
+            "profile (CONN_MAX_AGE or the psycopg pool). Run it with --settings=djangoProject_prod_DRF.settings_prod "
+            "to see the production profile.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, requests, database, **options):
+        configured = connections[database]
+        settings_dict = dict(configured.settings_dict, CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False,
+                             OPTIONS={k: v for k, v in configured.settings_dict['OPTIONS'].items() if k != 'pool'})
+        direct = configured.__class__(settings_dict, alias=f'{database}-direct')
+
+        def direct_request():
+            try:
+                with direct.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+            finally:
+                direct.close()
+
+        cases = (
+            ("new connection per request", direct_request),
+            ("configured profile", lambda: simulate_request(configured)),
+        )
+        for name, request in cases:
+            request()
+            samples = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                request()
+                samples.append((time.perf_counter() - start) * 1000)
+            p50, p95, p99 = percentiles(samples)
+            self.stdout.write(f"{name:<28} p50 {p50:.3f} ms  p95 {p95:.3f} ms  p99 {p99:.3f} ms")
+        if getattr(configured, 'pool', None) is not None:
+            self.stdout.write(f"pool stats: {configured.pool.get_stats()}")
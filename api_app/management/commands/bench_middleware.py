@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api_app.stateless import stock_middleware
+from .bench_db_connections import percentiles
+
+
+class Command(BaseCommand):
+    help = ("Times one API request through the stock Django middleware stack and through the stateless "
+            "stack from settings.MIDDLEWARE. Pass --token to time a JWT-authenticated route.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/ping')
+        parser.add_argument('--token')
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, path, token, requests, **options):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        factory = RequestFactory(SERVER_NAME='localhost')
+        cases = (
+            ("stock middleware", stock_middleware(settings.MIDDLEWARE)),
+            ("stateless middleware", list(settings.MIDDLEWARE)),
+        )
+        for name, middleware in cases:
+            with override_settings(MIDDLEWARE=middleware):
+                handler = WSGIHandler()
+                response = handler.get_response(factory.get(path, **headers))
+                samples = []
+                with CaptureQueriesContext(connection) as captured:
+                    for _ in range(requests):
+                        start = time.perf_counter()
+                        handler.get_response(factory.get(path, **headers))
+                        samples.append((time.perf_counter() - start) * 1000)
+            p50, p95, p99 = percentiles(samples)
+            self.stdout.write(f"{name:<22} status {response.status_code}  p50 {p50:.3f} ms  p95 {p95:.3f} ms  "
+                              f"p99 {p99:.3f} ms  queries/request {len(captured) / requests:.1f}  "
+                              f"cookies {sorted(response.cookies)}")
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from api_app.codes import with_pool_counts
+from api_app.counters import with_counters
+from api_app.fastpath import (render_json, promo_out_rows, promo_for_company_out_rows, PROMO_OUT_VALUES,
+                              PROMO_FOR_COMPANY_OUT_VALUES)
+from api_app.models import Promo
+from api_app.serializers import PromoOutSerializer, PromoForCompanyOutSerializer, NO_USER_FLAGS
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class Command(BaseCommand):
+    help = ("Compares DRF serializer + JSONRenderer against the fast path used by the feed and "
+            "company promo list. Reads existing promos, does not write anything.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, limit, repeat, **options):
+        promos = with_counters(Promo.objects.select_related('company')).order_by('active_from', 'id_promo')
+        feed = list(promos[:limit])
+        if not feed:
+            raise CommandError("No promos to serialize.")
+        feed_rows = list(promos.values(*PROMO_OUT_VALUES)[:limit])
+        company = with_counters(with_pool_counts(Promo.objects.select_related('company')))
+        company = company.order_by('active_from', 'id_promo')
+        company_objects = list(company[:limit])
+        company_rows = list(company.values(*PROMO_FOR_COMPANY_OUT_VALUES)[:limit])
+        context = {"user_flags": NO_USER_FLAGS}
+
+        cases = (
+            ("feed", len(feed),
+             lambda: JSONRenderer().render(PromoOutSerializer(feed, many=True, context=context).data),
+             lambda: render_json(promo_out_rows(feed_rows, NO_USER_FLAGS))),
+            ("company list", len(company_objects),
+             lambda: JSONRenderer().render(PromoForCompanyOutSerializer(company_objects, many=True).data),
+             lambda: render_json(*promo_for_company_out_rows(company_rows))),
+        )
+        for name, count, slow, fast in cases:
+            slow_time, fast_time = timed(slow, repeat), timed(fast, repeat)
+            self.stdout.write(f"{name} ({count} rows): drf {slow_time * 1000:.2f} ms, "
+                              f"fast {fast_time * 1000:.2f} ms, x{slow_time / fast_time:.1f}")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+def delete_in_batches(queryset, batch_size, pause):
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += model.objects.filter(id__in=ids).delete()[0]
+        if pause:
+            time.sleep(pause)
+
+
+class Command(BaseCommand):
+    help = ("Deletes expired outstanding and blacklisted JWT tokens in small batches. "
+            "Safe to run from cron while the API is serving traffic.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help="Seconds to sleep between batches.")
+
+    def handle(self, *args, batch_size, pause, **options):
+        now = timezone.now()
+        blacklisted = delete_in_batches(BlacklistedToken.objects.filter(token__expires_at__lte=now),
+                                        batch_size, pause)
+        outstanding = delete_in_batches(OutstandingToken.objects.filter(expires_at__lte=now),
+                                        batch_size, pause)
+        self.stdout.write(f"Deleted {blacklisted} blacklisted and {outstanding} outstanding tokens.")
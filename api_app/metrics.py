@@ -0,0 +1,241 @@
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .cache import cache_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+POOL_METRICS = (
+    ('pool_min', 'api_db_pool_min_size', 'gauge', 'Configured minimum pool size.', 1),
+    ('pool_max', 'api_db_pool_max_size', 'gauge', 'Configured maximum pool size.', 1),
+    ('pool_size', 'api_db_pool_size', 'gauge', 'Connections currently managed by the pool.', 1),
+    ('pool_available', 'api_db_pool_available', 'gauge', 'Idle connections ready for checkout.', 1),
+    ('requests_waiting', 'api_db_pool_requests_waiting', 'gauge', 'Checkouts waiting for a connection.', 1),
+    ('requests_num', 'api_db_pool_requests_total', 'counter', 'Connection checkouts.', 1),
+    ('requests_queued', 'api_db_pool_requests_queued_total', 'counter', 'Checkouts that had to wait.', 1),
+    ('requests_wait_ms', 'api_db_pool_requests_wait_seconds_total', 'counter', 'Time spent waiting for a connection.',
+     0.001),
+    ('requests_errors', 'api_db_pool_requests_errors_total', 'counter', 'Checkouts that timed out or failed.', 1),
+    ('connections_num', 'api_db_pool_connections_total', 'counter', 'Connections opened by the pool.', 1),
+    ('connections_lost', 'api_db_pool_connections_lost_total', 'counter',
+     'Connections found broken by the checkout health check.', 1),
+)
+
+
+def _empty_request_stats():
+    return {"buckets": [0] * len(LATENCY_BUCKETS), "count": 0, "duration": 0.0,
+            "queries": 0, "db_time": 0.0, "size": 0}
+
+
+def pool_stats():
+    stats = {}
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            stats[connection.alias] = pool.get_stats()
+    return stats
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (OSError, ValueError):
+        return True
+    return True
+
+
+def _merge(into, snapshot, pools=True):
+    for key, stats in snapshot["requests"].items():
+        target = into["requests"].setdefault(key, _empty_request_stats())
+        target["buckets"] = [a + b for a, b in zip(target["buckets"], stats["buckets"])]
+        for name in ("count", "duration", "queries", "db_time", "size"):
+            target[name] += stats[name]
+    for key, count in snapshot["statuses"].items():
+        into["statuses"][key] = into["statuses"].get(key, 0) + count
+    for result, count in snapshot.get("cache", {}).items():
+        into["cache"][result] = into["cache"].get(result, 0) + count
+    if pools:
+        for alias, stats in snapshot.get("pools", {}).items():
+            target = into["pools"].setdefault(alias, {})
+            for key, value in stats.items():
+                target[key] = target.get(key, 0) + value
+    return into
+
+
+class MetricsRegistry:
+    # Each worker keeps its own counters and periodically writes them to
+    # <directory>/metrics-<pid>.json; the scrape view sums every file.
+
+    def __init__(self, directory=None, flush_interval=None):
+        self.directory = directory or getattr(settings, 'METRICS_DIR', None)
+        self.flush_interval = flush_interval or getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+        self._requests = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        atexit.register(self.flush)
+
+    def observe(self, view, method, status, duration, queries, db_time, size):
+        key = f'{view}\t{method}'
+        with self._lock:
+            stats = self._requests.get(key)
+            if stats is None:
+                stats = self._requests[key] = _empty_request_stats()
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats["buckets"][index] += 1
+                    break
+            stats["count"] += 1
+            stats["duration"] += duration
+            stats["queries"] += queries
+            stats["db_time"] += db_time
+            stats["size"] += size
+            status_key = f'{key}\t{status}'
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+            due = self.directory and time.monotonic() - self._flushed_at >= self.flush_interval
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        pools = pool_stats()
+        with self._lock:
+            return {
+                "requests": {key: dict(stats, buckets=list(stats["buckets"])) for key, stats in self._requests.items()},
+                "statuses": dict(self._statuses),
+                "pools": pools,
+                "cache": cache_stats(),
+            }
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        if not self.directory:
+            return
+        self._flushed_at = time.monotonic()
+        path = self._path(os.getpid())
+        tmp = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def collect(self):
+        merged = {"requests": {}, "statuses": {}, "pools": {}, "cache": {}}
+        own = self._path(os.getpid()) if self.directory else None
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if not name.endswith('.json') or path == own:
+                    continue
+                pid = name[len('metrics-'):-len('.json')]
+                try:
+                    with open(path) as f:
+                        _merge(merged, json.load(f), pools=pid.isdigit() and _alive(int(pid)))
+                except (OSError, ValueError):
+                    continue
+        return _merge(merged, self.snapshot())
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(data):
+    lines = [
+        '# HELP api_request_duration_seconds Request latency by view and method.',
+        '# TYPE api_request_duration_seconds histogram',
+    ]
+    requests = sorted((key.split('\t'), stats) for key, stats in data["requests"].items())
+    for (view, method), stats in requests:
+        labels = f'view="{_label(view)}",method="{_label(method)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, stats["buckets"]):
+            cumulative += count
+            lines.append(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+        lines.append(f'api_request_duration_seconds_sum{{{labels}}} {stats["duration"]}')
+        lines.append(f'api_request_duration_seconds_count{{{labels}}} {stats["count"]}')
+    for name, field, help_text in (
+        ('api_db_queries_total', 'queries', 'Database queries run while serving requests.'),
+        ('api_db_query_duration_seconds_total', 'db_time', 'Time spent in database queries.'),
+        ('api_response_size_bytes_total', 'size', 'Response body bytes sent.'),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (view, method), stats in requests:
+            lines.append(f'{name}{{view="{_label(view)}",method="{_label(method)}"}} {stats[field]}')
+    lines.append('# HELP api_responses_total Responses by view, method and status code.')
+    lines.append('# TYPE api_responses_total counter')
+    for key, count in sorted(data["statuses"].items()):
+        view, method, status = key.split('\t')
+        lines.append(f'api_responses_total{{view="{_label(view)}",method="{_label(method)}",'
+                     f'status="{status}"}} {count}')
+    cache = sorted(data.get("cache", {}).items())
+    if cache:
+        lines.append('# HELP api_promo_cache_requests_total Promo payload cache lookups by result.')
+        lines.append('# TYPE api_promo_cache_requests_total counter')
+        for result, count in cache:
+            lines.append(f'api_promo_cache_requests_total{{result="{_label(result)}"}} {count}')
+    pools = sorted(data.get("pools", {}).items())
+    if pools:
+        for key, name, kind, help_text, scale in POOL_METRICS:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for alias, stats in pools:
+                lines.append(f'{name}{{alias="{_label(alias)}"}} {stats.get(key, 0) * scale}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        size = 0 if response.streaming else len(response.content)
+        method = request.method if request.method in METHODS else 'OTHER'
+        metrics.observe(match.view_name if match else 'unmatched', method, response.status_code,
+                        duration, timer.count, timer.duration, size)
+        return response
+
+
+metrics = MetricsRegistry()
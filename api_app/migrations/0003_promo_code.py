@@ -0,0 +1,50 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_unique_codes(apps, schema_editor):
+    Promo = apps.get_model('api_app', 'Promo')
+    PromoCode = apps.get_model('api_app', 'PromoCode')
+    promos = Promo.objects.exclude(promo_unique=[]).values_list('id_promo', 'promo_unique')
+    for id_promo, codes in promos.iterator(chunk_size=100):
+        PromoCode.objects.bulk_create(
+            (PromoCode(promo_id=id_promo, code=code) for code in codes),
+            batch_size=5000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0002_alter_promo_promo_common'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='promo',
+            name='max_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PromoCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=200)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('claimed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api_app.user')),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='codes', to='api_app.promo')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('claimed_at__isnull', True)), fields=['promo', 'id'], name='promo_code_free_idx')],
+                'constraints': [models.UniqueConstraint(fields=('promo', 'code'), name='promo_code_unique')],
+            },
+        ),
+        migrations.RunPython(copy_unique_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='promo',
+            name='promo_unique',
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:44
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def target_columns(target):
+    country = target.get('country')
+    categories = target.get('categories')
+    return {
+        'target_country': country.lower() if isinstance(country, str) else None,
+        'target_age_from': _int_or_none(target.get('age_from')),
+        'target_age_until': _int_or_none(target.get('age_until')),
+        'target_categories': [c.lower() for c in categories if isinstance(c, str)]
+        if isinstance(categories, list) else [],
+    }
+
+
+def backfill_target_columns(apps, schema_editor):
+    Promo = apps.get_model('api_app', 'Promo')
+    fields = ['target_country', 'target_age_from', 'target_age_until', 'target_categories']
+    batch = []
+    for promo in Promo.objects.only('id_promo', 'target').iterator(chunk_size=2000):
+        for attr, value in target_columns(promo.target or {}).items():
+            setattr(promo, attr, value)
+        batch.append(promo)
+        if len(batch) >= 2000:
+            Promo.objects.bulk_update(batch, fields)
+            batch = []
+    if batch:
+        Promo.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0003_promo_code'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promo',
+            name='target_age_from',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='promo',
+            name='target_age_until',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='promo',
+            name='target_categories',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='promo',
+            name='target_country',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(backfill_target_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='promo',
+            index=models.Index(fields=['company', 'target_country'], name='promo_company_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promo',
+            index=models.Index(fields=['target_country', 'target_age_from', 'target_age_until'], name='promo_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='promo',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['target_categories'], name='promo_categories_gin'),
+        ),
+    ]
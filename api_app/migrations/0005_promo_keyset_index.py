@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0004_promo_target_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promo',
+            index=models.Index(fields=['active_from', 'id_promo'], name='promo_keyset_idx'),
+        ),
+    ]
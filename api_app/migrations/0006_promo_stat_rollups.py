@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0005_promo_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoCountryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(max_length=100)),
+                ('activations', models.IntegerField(default=0)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='country_stats', to='api_app.promo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'country'), name='promo_country_stat_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PromoDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('activations', models.IntegerField(default=0)),
+                ('likes', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api_app.promo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'day'), name='promo_daily_stat_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0006_promo_stat_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=200)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api_app.promo')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='api_app.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['promo', 'created_at'], name='activation_event_promo_idx'), models.Index(fields=['user', 'created_at'], name='activation_event_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0007_activation_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='promocomment',
+            index=models.Index(fields=['promo', '-date', '-comment_id'], name='promo_comment_date_idx'),
+        ),
+    ]
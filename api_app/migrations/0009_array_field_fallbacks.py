@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:58
+
+import api_app.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0008_promo_comment_date_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name='promo',
+                    name='promo_categories_gin',
+                ),
+                migrations.AddIndex(
+                    model_name='promo',
+                    index=api_app.fields.GinIndex(fields=['target_categories'], name='promo_categories_gin'),
+                ),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='promo',
+            name='target_categories',
+            field=api_app.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='activated_promos',
+            field=api_app.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='liked_promos',
+            field=api_app.fields.ArrayField(base_field=models.CharField(max_length=100), blank=True, default=list, size=None),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_ranks(apps, schema_editor):
+    Promo = apps.get_model('api_app', 'Promo')
+    PromoRank = apps.get_model('api_app', 'PromoRank')
+    batch = []
+    promos = Promo.objects.only('id_promo', 'like_count', 'used_count', 'target_categories')
+    for promo in promos.iterator(chunk_size=2000):
+        score = promo.like_count + promo.used_count
+        for category in {'', *promo.target_categories}:
+            batch.append(PromoRank(promo_id=promo.id_promo, category=category, score=score))
+        if len(batch) >= 5000:
+            PromoRank.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PromoRank.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0009_array_field_fallbacks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(blank=True, max_length=100)),
+                ('score', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='promo',
+            index=models.Index(fields=['active_until', 'id_promo'], name='promo_ending_idx'),
+        ),
+        migrations.AddField(
+            model_name='promorank',
+            name='promo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranks', to='api_app.promo'),
+        ),
+        migrations.AddIndex(
+            model_name='promorank',
+            index=models.Index(fields=['category', '-score', '-promo'], name='promo_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='promorank',
+            constraint=models.UniqueConstraint(fields=('promo', 'category'), name='promo_rank_unique'),
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+    ]
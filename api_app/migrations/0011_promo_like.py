@@ -0,0 +1,56 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:10
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_likes(apps, schema_editor):
+    User = apps.get_model('api_app', 'User')
+    Promo = apps.get_model('api_app', 'Promo')
+    PromoLike = apps.get_model('api_app', 'PromoLike')
+    existing = set(Promo.objects.values_list('id_promo', flat=True))
+    batch = []
+    users = User.objects.exclude(liked_promos=[]).only('liked_promos')
+    for user in users.iterator(chunk_size=2000):
+        for value in set(user.liked_promos):
+            try:
+                promo_id = uuid.UUID(value)
+            except ValueError:
+                continue
+            if promo_id in existing:
+                batch.append(PromoLike(user_id=user.pk, promo_id=promo_id))
+        if len(batch) >= 5000:
+            PromoLike.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        PromoLike.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0010_promo_rank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='api_app.promo')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='likes', to='api_app.user')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'promo'), name='promo_like_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_likes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='liked_promos',
+        ),
+    ]
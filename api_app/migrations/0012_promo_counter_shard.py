@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0011_promo_like'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('likes', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('promo', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='api_app.promo')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('promo', 'day', 'shard'), name='promo_counter_shard_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:18
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Min
+from django.utils import timezone
+
+
+def backfill_activations(apps, schema_editor):
+    User = apps.get_model('api_app', 'User')
+    Promo = apps.get_model('api_app', 'Promo')
+    ActivationEvent = apps.get_model('api_app', 'ActivationEvent')
+    PromoActivation = apps.get_model('api_app', 'PromoActivation')
+    existing = set(Promo.objects.values_list('id_promo', flat=True))
+    first_seen = dict(
+        ((user_id, promo_id), created_at) for user_id, promo_id, created_at in
+        ActivationEvent.objects.order_by().values('user_id', 'promo_id').annotate(first=Min('created_at'))
+        .values_list('user_id', 'promo_id', 'first')
+    )
+    now = timezone.now()
+    batch = []
+    users = User.objects.exclude(activated_promos=[]).only('activated_promos')
+    for user in users.iterator(chunk_size=2000):
+        for value in set(user.activated_promos):
+            try:
+                promo_id = uuid.UUID(value)
+            except ValueError:
+                continue
+            if promo_id in existing:
+                batch.append(PromoActivation(user_id=user.pk, promo_id=promo_id,
+                                             activated_at=first_seen.get((user.pk, promo_id), now)))
+        if len(batch) >= 5000:
+            PromoActivation.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PromoActivation.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0012_promo_counter_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoActivation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('activated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('promo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activations', to='api_app.promo')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activations', to='api_app.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-activated_at', '-id'], name='promo_activation_history_idx'), models.Index(fields=['user', 'promo'], name='promo_activation_user_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_activations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='activated_promos',
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:21
+
+import api_app.fields
+from django.db import migrations
+
+
+def install_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE TRIGGER promo_search_vector_update BEFORE INSERT OR UPDATE OF description ON api_app_promo "
+        "FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.russian', description)"
+    )
+    schema_editor.execute("UPDATE api_app_promo SET search_vector = to_tsvector('pg_catalog.russian', description)")
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP TRIGGER IF EXISTS promo_search_vector_update ON api_app_promo")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_app', '0013_promo_activation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promo',
+            name='search_vector',
+            field=api_app.fields.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='promo',
+            index=api_app.fields.GinIndex(fields=['search_vector'], name='promo_search_gin'),
+        ),
+        migrations.RunPython(install_search_trigger, drop_search_trigger),
+    ]
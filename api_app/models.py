@@ -1,9 +1,10 @@
 import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, UserManager
-from django.contrib.postgres.fields import ArrayField
 from django.utils import timezone
 
+from .fields import ArrayField, GinIndex, SearchVectorField
+
 
 class BaseEntity(AbstractBaseUser, PermissionsMixin):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
@@ -22,6 +23,48 @@ class Company(BaseEntity):
     email = models.EmailField(unique=True)
 
 
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def target_columns(target):
+    country = target.get('country')
+    categories = target.get('categories')
+    return {
+        'target_country': country.lower() if isinstance(country, str) else None,
+        'target_age_from': _int_or_none(target.get('age_from')),
+        'target_age_until': _int_or_none(target.get('age_until')),
+        'target_categories': [c.lower() for c in categories if isinstance(c, str)]
+        if isinstance(categories, list) else [],
+    }
+
+
+def eligibility_q(profile):
+    profile = profile or {}
+    country = profile.get('country')
+    age = _int_or_none(profile.get('age'))
+    condition = models.Q(target_country__isnull=True)
+    if isinstance(country, str):
+        condition |= models.Q(target_country=country.lower())
+    if age is None:
+        return condition & models.Q(target_age_from__isnull=True, target_age_until__isnull=True)
+    return (condition
+            & (models.Q(target_age_from__isnull=True) | models.Q(target_age_from__lte=age))
+            & (models.Q(target_age_until__isnull=True) | models.Q(target_age_until__gte=age)))
+
+
+class PromoQuerySet(models.QuerySet):
+    def eligible_for(self, profile):
+        return self.filter(eligibility_q(profile))
+
+    def with_eligibility(self, profile):
+        return self.annotate(is_eligible=models.ExpressionWrapper(eligibility_q(profile),
+                                                                  output_field=models.BooleanField()))
+
+
 class Promo(models.Model):
     company = models.ForeignKey(BaseEntity, on_delete=models.PROTECT)
     id_promo = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -33,11 +76,33 @@ class Promo(models.Model):
     active_until = models.DateField()
     mode = models.CharField(max_length=20)
     promo_common = models.CharField(max_length=100, blank=True)
-    promo_unique = ArrayField(models.CharField(max_length=200), default=list, blank=True)
     active = models.BooleanField(default=True)
     like_count = models.IntegerField(default=0)
     comment_count = models.IntegerField(default=0)
     used_count = models.IntegerField(default=0)
+    target_country = models.CharField(max_length=100, null=True, blank=True)
+    target_age_from = models.IntegerField(null=True, blank=True)
+    target_age_until = models.IntegerField(null=True, blank=True)
+    target_categories = ArrayField(models.CharField(max_length=100), default=list, blank=True)
+    # Filled by a database trigger from description (migration 0014).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = PromoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'target_country'], name='promo_company_country_idx'),
+            models.Index(fields=['target_country', 'target_age_from', 'target_age_until'],
+                         name='promo_target_idx'),
+            GinIndex(fields=['target_categories'], name='promo_categories_gin'),
+            models.Index(fields=['active_from', 'id_promo'], name='promo_keyset_idx'),
+            models.Index(fields=['active_until', 'id_promo'], name='promo_ending_idx'),
+            GinIndex(fields=['search_vector'], name='promo_search_gin'),
+        ]
+
+    def sync_target_columns(self):
+        for attr, value in target_columns(self.target or {}).items():
+            setattr(self, attr, value)
 
 
 class User(BaseEntity):
@@ -46,8 +111,6 @@ class User(BaseEntity):
     surname = models.CharField(max_length=255)
     avatar_url = models.URLField(blank=True, null=True)
     other = models.JSONField(blank=True, null=True)
-    activated_promos = ArrayField(models.CharField(max_length=100), default=list, blank=True)
-    liked_promos = ArrayField(models.CharField(max_length=100), default=list, blank=True)
 
 
 class PromoComment(models.Model):
@@ -56,3 +119,112 @@ class PromoComment(models.Model):
     author = models.ForeignKey(User, on_delete=models.PROTECT)
     comment_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     text = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['promo', '-date', '-comment_id'], name='promo_comment_date_idx'),
+        ]
+
+
+class PromoCode(models.Model):
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='codes')
+    code = models.CharField(max_length=200)
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'code'], name='promo_code_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['promo', 'id'], condition=models.Q(claimed_at__isnull=True),
+                         name='promo_code_free_idx'),
+        ]
+
+
+class PromoDailyStat(models.Model):
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    activations = models.IntegerField(default=0)
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'day'], name='promo_daily_stat_unique'),
+        ]
+
+
+class PromoCounterShard(models.Model):
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='counter_shards', db_index=False)
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField()
+    likes = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'day', 'shard'], name='promo_counter_shard_unique'),
+        ]
+
+
+class PromoCountryStat(models.Model):
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='country_stats')
+    country = models.CharField(max_length=100)
+    activations = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'country'], name='promo_country_stat_unique'),
+        ]
+
+
+class PromoActivation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activations', db_index=False)
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='activations')
+    activated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-activated_at', '-id'], name='promo_activation_history_idx'),
+            models.Index(fields=['user', 'promo'], name='promo_activation_user_idx'),
+        ]
+
+
+class PromoLike(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes', db_index=False)
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='likes')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'promo'], name='promo_like_unique'),
+        ]
+
+
+class PromoRank(models.Model):
+    promo = models.ForeignKey(Promo, on_delete=models.CASCADE, related_name='ranks')
+    category = models.CharField(max_length=100, blank=True)
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promo', 'category'], name='promo_rank_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['category', '-score', '-promo'], name='promo_rank_idx'),
+        ]
+
+
+class ActivationEvent(models.Model):
+    promo = models.ForeignKey(Promo, on_delete=models.PROTECT)
+    user = models.ForeignKey(User, on_delete=models.PROTECT)
+    code = models.CharField(max_length=200)
+    country = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['promo', 'created_at'], name='activation_event_promo_idx'),
+            models.Index(fields=['user', 'created_at'], name='activation_event_user_idx'),
+        ]
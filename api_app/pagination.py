@@ -0,0 +1,125 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    message = "Invalid cursor."
+
+
+class InvalidPageParam(InvalidCursor):
+
+    def __init__(self, name, minimum, maximum=None):
+        super().__init__(name)
+        if maximum is None:
+            self.message = f"'{name}' must be an integer of at least {minimum}."
+        else:
+            self.message = f"'{name}' must be an integer from {minimum} to {maximum}."
+
+
+class Page:
+    def __init__(self, items, total_count=None, next_cursor=None, is_cursor=False):
+        self.items = items
+        self.total_count = total_count
+        self.next_cursor = next_cursor
+        self.is_cursor = is_cursor
+
+    def apply_headers(self, response):
+        if self.total_count is not None:
+            response['X-Total-Count'] = self.total_count
+        if self.next_cursor:
+            response['X-Next-Cursor'] = self.next_cursor
+        return response
+
+
+def _value(item, field):
+    if isinstance(item, dict):
+        return item[field]
+    return getattr(item, field)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps([str(value) for value in values]).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise InvalidCursor()
+    # encode_cursor only ever writes a list of strings.
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise InvalidCursor()
+    return values
+
+
+def keyset_filter(ordering, values):
+    condition = Q()
+    for i, field in enumerate(ordering):
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f"{field.lstrip('-')}__{lookup}": values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def estimate_count(queryset):
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_for(queryset, mode):
+    if mode == 'exact':
+        return queryset.count()
+    if mode == 'estimate':
+        return estimate_count(queryset)
+    return None
+
+
+def _int_param(request, name, default, minimum, maximum=None):
+    try:
+        value = int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        raise InvalidPageParam(name, minimum, maximum)
+    if value < minimum or (maximum is not None and value > maximum):
+        raise InvalidPageParam(name, minimum, maximum)
+    return value
+
+
+def paginate(request, queryset, ordering, keyset_only=False):
+    limit = _int_param(request, 'limit', 10, 1, getattr(settings, 'MAX_PAGE_SIZE', 100))
+    cursor = request.query_params.get('cursor', '' if keyset_only else None)
+    # The ordering ends in the primary key, so both modes page over a total order.
+    queryset = queryset.order_by(*ordering)
+    if cursor is None:
+        offset = _int_param(request, 'offset', 0, 0)
+        paginator = Paginator(queryset, limit)
+        return Page(list(paginator.page((offset // limit) + 1)), paginator.count)
+
+    total_count = count_for(queryset, request.query_params.get('count'))
+    if cursor:
+        values = decode_cursor(cursor, len(ordering))
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor()
+    items = list(queryset[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor([_value(items[-1], field.lstrip('-')) for field in ordering])
+    return Page(items, total_count, next_cursor, is_cursor=True)
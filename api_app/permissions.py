@@ -1,14 +1,43 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 from .models import Company, User
+from .tokens import ROLE_COMPANY, ROLE_USER
+
+
+def token_role(request):
+    if request.auth is None or not hasattr(request.auth, 'get'):
+        return None
+    return request.auth.get('role')
 
 
 class IsCompany(BasePermission):
 
     def has_permission(self, request, view):
+        role = token_role(request)
+        if role is not None:
+            return role == ROLE_COMPANY
         return bool(request.user and Company.objects.filter(id=request.user.id).exists())
 
 
+class IsMetricsScraper(BasePermission):
+    # The scrape endpoint has no JWT: it takes METRICS_TOKEN as a bearer token, or a request from
+    # METRICS_ALLOWED_IPS (REMOTE_ADDR only, forwarded headers can be forged).
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        if token:
+            header = request.META.get('HTTP_AUTHORIZATION', '')
+            if hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+                return True
+        return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
 class IsUser(BasePermission):
 
     def has_permission(self, request, view):
+        role = token_role(request)
+        if role is not None:
+            return role == ROLE_USER
         return bool(request.user and User.objects.filter(id=request.user.id).exists())
@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import PromoRank
+
+OVERALL = ''
+LIKE_WEIGHT = 1
+ACTIVATION_WEIGHT = 1
+BULK_BATCH_SIZE = 5000
+
+
+def promo_score(promo):
+    return promo.like_count * LIKE_WEIGHT + promo.used_count * ACTIVATION_WEIGHT
+
+
+def rank_categories(promo):
+    return {OVERALL, *promo.target_categories}
+
+
+def sync_ranks(promos, created=False):
+    wanted = {(promo.id_promo, category): promo for promo in promos for category in rank_categories(promo)}
+    if not wanted:
+        return
+    existing = set() if created else set(
+        PromoRank.objects.filter(promo_id__in={promo_id for promo_id, _ in wanted}).values_list('promo_id', 'category'))
+    stale = defaultdict(list)
+    for promo_id, category in existing - set(wanted):
+        stale[promo_id].append(category)
+    for promo_id, categories in stale.items():
+        PromoRank.objects.filter(promo_id=promo_id, category__in=categories).delete()
+    PromoRank.objects.bulk_create([
+        PromoRank(promo_id=promo_id, category=category, score=promo_score(promo))
+        for (promo_id, category), promo in wanted.items() if (promo_id, category) not in existing
+    ], ignore_conflicts=True, batch_size=BULK_BATCH_SIZE)
+
+
+def bump_ranks(deltas):
+    deltas = {promo_id: delta for promo_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    PromoRank.objects.filter(promo_id__in=deltas).update(score=F('score') + Case(
+        *[When(promo_id=promo_id, then=Value(delta)) for promo_id, delta in deltas.items()],
+        output_field=IntegerField(),
+    ))
@@ -0,0 +1,113 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import LazyObject
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_request_state = ContextVar('replica_request_state', default=None)
+_force_primary = ContextVar('replica_force_primary', default=False)
+
+
+def _replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def _pin_key(user_id):
+    return f'primary-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    # Reads of this user go to the primary until replicas have caught up with the write. The pin
+    # lives in the default cache, so it only follows the user to other workers if that cache is shared.
+    cache.set(_pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+    state = _request_state.get()
+    if state is not None:
+        state['pinned'] = True
+
+
+@contextmanager
+def reads_from_primary():
+    token = _force_primary.set(True)
+    try:
+        yield
+    finally:
+        _force_primary.reset(token)
+
+
+def _authenticated_user(request):
+    # request.user stays lazy until the view has authenticated the request.
+    user = request.__dict__.get('user')
+    if user is None or isinstance(user, LazyObject) or not user.is_authenticated:
+        return None
+    return user
+
+
+def _pinned():
+    if _force_primary.get():
+        return True
+    state = _request_state.get()
+    if state is None:
+        return False
+    if state['pinned'] is None:
+        user = _authenticated_user(state['request'])
+        if user is None:
+            return False
+        state['pinned'] = bool(cache.get(_pin_key(user.id)))
+    return state['pinned']
+
+
+def check_pin_cache(app_configs, **kwargs):
+    if _replicas() and isinstance(caches['default'], LocMemCache):
+        return [checks.Warning(
+            "Read-your-writes pins are kept in a per-process LocMemCache.",
+            hint="With several workers a user can read a stale replica right after a write; "
+                 "configure a shared cache such as Redis (see settings_prod).",
+            id='api_app.W001',
+        )]
+    return []
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = _replicas()
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block or _pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in _replicas():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Writes read from the primary too, so read-modify-write never starts from a stale row.
+        safe = request.method in SAFE_METHODS
+        token = _request_state.set({'request': request, 'pinned': None if safe else True})
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        user = None if safe or response.status_code >= 400 else _authenticated_user(request)
+        if user is not None:
+            pin_to_primary(user.id)
+        return response
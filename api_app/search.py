@@ -0,0 +1,79 @@
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Func
+
+SEARCH_CONFIG = 'russian'
+
+FTS_TABLE = 'api_app_promo_fts'
+
+# SQLite has no tsvector; an FTS5 index over api_app_promo.description, kept in sync by triggers,
+# stands in for the search_vector column and its GIN index.
+SQLITE_FTS_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(description, content='api_app_promo')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_app_promo BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.rowid, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_app_promo BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.rowid, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF description ON api_app_promo BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.rowid, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.rowid, new.description); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+
+def install_sqlite_fts(using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in SQLITE_FTS_SCHEMA:
+            cursor.execute(statement)
+
+
+def fts_query(q):
+    # Every word becomes a quoted FTS5 string, so user input can't use FTS5 query syntax.
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in q.split())
+
+
+class _Search(Func):
+
+    def __init__(self, q):
+        self.q = q
+        super().__init__(F('search_vector'), F('id_promo'))
+
+    def _compile(self, compiler):
+        return [compiler.compile(expression) for expression in self.get_source_expressions()]
+
+
+class SearchMatch(_Search):
+    output_field = BooleanField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        (vector, vector_params), _ = self._compile(compiler)
+        return (f"{vector} @@ websearch_to_tsquery(%s::regconfig, %s)",
+                [*vector_params, SEARCH_CONFIG, self.q])
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        _, (promo_id, promo_id_params) = self._compile(compiler)
+        return (f"{promo_id} IN (SELECT promo.id_promo FROM api_app_promo promo "
+                f"JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = promo.rowid WHERE {FTS_TABLE} MATCH %s)",
+                [*promo_id_params, fts_query(self.q)])
+
+
+class SearchRank(_Search):
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        (vector, vector_params), _ = self._compile(compiler)
+        # float8 so the value survives a round trip through a keyset cursor unchanged.
+        return (f"ts_rank({vector}, websearch_to_tsquery(%s::regconfig, %s))::float8",
+                [*vector_params, SEARCH_CONFIG, self.q])
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        _, (promo_id, promo_id_params) = self._compile(compiler)
+        return (f"(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} JOIN api_app_promo promo "
+                f"ON promo.rowid = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s AND promo.id_promo = {promo_id})",
+                [fts_query(self.q), *promo_id_params])
+
+
+def search_promos(queryset, q):
+    return queryset.filter(SearchMatch(q)).annotate(search_rank=SearchRank(q))
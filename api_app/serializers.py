@@ -1,7 +1,14 @@
 from django.contrib.auth.hashers import make_password
 from rest_framework import serializers
-from api_app.models import Company, Promo, User, PromoComment
+from api_app.models import Company, Promo, PromoActivation, PromoLike, User, PromoComment, target_columns
+from api_app.cache import invalidate_promo
+from api_app.codes import add_codes, replace_free_codes, free_codes
+from api_app.counters import pending_counts
+from api_app.ranking import sync_ranks
 from django.core.validators import RegexValidator
+from django.db.models import Value
+
+TARGET_FIELDS = ('target', 'target_country', 'target_age_from', 'target_age_until', 'target_categories')
 
 
 class CompanySerializer(serializers.Serializer):
@@ -26,6 +33,8 @@ class CompanySerializer(serializers.Serializer):
 
 class PromoSerializer(serializers.ModelSerializer):
     target = serializers.JSONField(default=dict)
+    promo_unique = serializers.ListField(child=serializers.CharField(max_length=200), write_only=True,
+                                         required=False)
 
     class Meta:
         model = Promo
@@ -35,6 +44,11 @@ class PromoSerializer(serializers.ModelSerializer):
             'promo_unique', 'active'
         )
 
+    def validate_target(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Поле 'target' должно быть объектом.")
+        return value
+
     def validate(self, data):
         target = data.get('target', {})
         active_from = target.get('active_from')
@@ -56,7 +70,7 @@ class PromoSerializer(serializers.ModelSerializer):
 
         return data
 
-    def create(self, validated_data):
+    def build_instance(self, validated_data):
         target = validated_data.get('target', {})
         if 'country' in target and isinstance(target['country'], str):
             target['country'] = target['country'].lower()
@@ -64,16 +78,42 @@ class PromoSerializer(serializers.ModelSerializer):
         if isinstance(categories, list):
             target['categories'] = [str(category).lower() for category in categories if isinstance(category, str)]
         validated_data['target'] = target
-        return super().create(validated_data)
+        validated_data.update(target_columns(target))
+        return Promo(**validated_data)
 
-    def update(self, instance, validated_data):
+    def apply_update(self, instance, validated_data):
+        # Returns the new codes and the columns to write: only what the request set, so the counters
+        # that likes, comments and activations move concurrently are never overwritten with stale values.
         target = validated_data.get('target', instance.target)
         if 'country' in target and isinstance(target['country'], str):
             target['country'] = target['country'].lower()
         instance.target = target
+        promo_unique = validated_data.pop('promo_unique', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
+        instance.sync_target_columns()
+        fields = {*validated_data, *TARGET_FIELDS} if 'target' in validated_data else set(validated_data)
+        return promo_unique, sorted(fields)
+
+    def create(self, validated_data):
+        promo_unique = validated_data.pop('promo_unique', [])
+        promo = self.build_instance(validated_data)
+        promo.save(force_insert=True)
+        sync_ranks([promo], created=True)
+        if promo_unique:
+            add_codes(promo, promo_unique)
+        invalidate_promo(promo.id_promo)
+        return promo
+
+    def update(self, instance, validated_data):
+        promo_unique, fields = self.apply_update(instance, validated_data)
+        if fields:
+            instance.save(update_fields=fields)
+        if 'target' in validated_data:
+            sync_ranks([instance])
+        invalidate_promo(instance.id_promo)
+        if promo_unique is not None:
+            replace_free_codes(instance, promo_unique)
         return instance
 
 
@@ -113,7 +153,6 @@ class UserSerializer(serializers.ModelSerializer):
         password = validated_data.pop("password", None)
         if password:
             instance.password = make_password(password)
-        print(validated_data.items())
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
@@ -121,6 +160,31 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
+NO_USER_FLAGS = {"liked": frozenset(), "activated": frozenset()}
+
+
+def user_promo_flags(user, promo_ids=None):
+    if not (user and user.is_authenticated):
+        return NO_USER_FLAGS
+    flagged = []
+    for model, flag in ((PromoLike, "liked"), (PromoActivation, "activated")):
+        rows = model.objects.filter(user_id=user.id)
+        if promo_ids is not None:
+            rows = rows.filter(promo_id__in=promo_ids)
+        flagged.append(rows.annotate(flag=Value(flag)).values_list('promo_id', 'flag'))
+    flags = {"liked": set(), "activated": set()}
+    for promo_id, flag in flagged[0].union(flagged[1]):
+        flags[flag].add(str(promo_id))
+    return {flag: frozenset(promo_ids) for flag, promo_ids in flags.items()}
+
+
+def with_user_flags(data, flags):
+    data = dict(data)
+    data["is_activated_by_user"] = data["promo_id"] in flags["activated"]
+    data["is_liked_by_user"] = data["promo_id"] in flags["liked"]
+    return data
+
+
 class PromoOutSerializer(serializers.ModelSerializer):
     company_id = serializers.UUIDField(source="company.id", read_only=True)
     company_name = serializers.CharField(source="company.name", read_only=True)
@@ -128,6 +192,8 @@ class PromoOutSerializer(serializers.ModelSerializer):
 
     is_activated_by_user = serializers.SerializerMethodField()
     is_liked_by_user = serializers.SerializerMethodField()
+    like_count = serializers.SerializerMethodField()
+    comment_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Promo
@@ -144,23 +210,27 @@ class PromoOutSerializer(serializers.ModelSerializer):
             "comment_count",
         )
 
+    def _user_flags(self):
+        flags = self.context.get("user_flags")
+        if flags is None:
+            flags = self.context["user_flags"] = user_promo_flags(self.context.get("request").user)
+        return flags
+
     def get_is_activated_by_user(self, obj):
-        user = self.context.get("request").user.user
-        if user.is_authenticated:
-            return str(obj.id_promo) in user.activated_promos
-        return False
+        return str(obj.id_promo) in self._user_flags()["activated"]
 
     def get_is_liked_by_user(self, obj):
-        user = self.context.get("request").user.user
-        if user.is_authenticated:
-            return str(obj.id_promo) in user.liked_promos
-        return False
+        return str(obj.id_promo) in self._user_flags()["liked"]
 
     def get_like_count(self, obj):
-        return 0
+        if hasattr(obj, 'like_total'):
+            return obj.like_total
+        return obj.like_count + pending_counts(obj.id_promo)['likes']
 
     def get_comment_count(self, obj):
-        return 0
+        if hasattr(obj, 'comment_total'):
+            return obj.comment_total
+        return obj.comment_count + pending_counts(obj.id_promo)['comments']
 
 
 class PromoCommentSerializer(serializers.ModelSerializer):
@@ -195,10 +265,26 @@ class PromoCommentOutSerializer(serializers.ModelSerializer):
         fields = ('id', 'text', 'date', 'author')
 
 
+class PromoActivationOutSerializer(serializers.ModelSerializer):
+    promo_id = serializers.UUIDField(source="promo.id_promo", read_only=True)
+    company_id = serializers.UUIDField(source="promo.company_id", read_only=True)
+    company_name = serializers.CharField(source="promo.company.name", read_only=True)
+    description = serializers.CharField(source="promo.description", read_only=True)
+    image_url = serializers.URLField(source="promo.image_url", read_only=True)
+    active = serializers.BooleanField(source="promo.active", read_only=True)
+
+    class Meta:
+        model = PromoActivation
+        fields = ("promo_id", "company_id", "company_name", "description", "image_url", "active", "activated_at")
+
+
 class PromoForCompanyOutSerializer(serializers.ModelSerializer):
     promo_id = serializers.UUIDField(source="id_promo", read_only=True)
     company_id = serializers.UUIDField(source="company.id", read_only=True)
     company_name = serializers.CharField(source="company.name", read_only=True)
+    promo_unique_total = serializers.SerializerMethodField()
+    promo_unique_available = serializers.SerializerMethodField()
+    like_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Promo
@@ -211,7 +297,8 @@ class PromoForCompanyOutSerializer(serializers.ModelSerializer):
             'active_until',
             'mode',
             'promo_common',
-            'promo_unique',
+            'promo_unique_total',
+            'promo_unique_available',
             'promo_id',
             'company_id',
             'company_name',
@@ -219,3 +306,24 @@ class PromoForCompanyOutSerializer(serializers.ModelSerializer):
             'used_count',
             'active',
         )
+
+    def get_promo_unique_total(self, obj):
+        if hasattr(obj, 'promo_unique_total'):
+            return obj.promo_unique_total
+        return obj.codes.count()
+
+    def get_promo_unique_available(self, obj):
+        if hasattr(obj, 'promo_unique_available'):
+            return obj.promo_unique_available
+        return obj.codes.filter(claimed_at__isnull=True).count()
+
+    def get_like_count(self, obj):
+        if hasattr(obj, 'like_total'):
+            return obj.like_total
+        return obj.like_count + pending_counts(obj.id_promo)['likes']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if self.context.get('include_codes'):
+            data['promo_unique'] = free_codes(instance)
+        return data
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.module_loading import import_string
+
+
+def is_stateless(request):
+    prefix = getattr(settings, 'STATELESS_API_PREFIX', None)
+    return bool(prefix) and request.path_info.startswith(prefix)
+
+
+class StatelessSkipMixin:
+    # JWT-authenticated API requests never read a session, a CSRF cookie or flash messages,
+    # so the wrapped middleware only runs for the admin and other non-API paths.
+    sync_capable = True
+    async_capable = False
+
+    def __call__(self, request):
+        if is_stateless(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class StatelessSessionMiddleware(StatelessSkipMixin, SessionMiddleware):
+    pass
+
+
+class StatelessCsrfViewMiddleware(StatelessSkipMixin, CsrfViewMiddleware):
+    pass
+
+
+class StatelessAuthenticationMiddleware(StatelessSkipMixin, AuthenticationMiddleware):
+    pass
+
+
+class StatelessMessageMiddleware(StatelessSkipMixin, MessageMiddleware):
+    pass
+
+
+class StatelessXFrameOptionsMiddleware(StatelessSkipMixin, XFrameOptionsMiddleware):
+    pass
+
+
+def stock_middleware(middleware):
+    # The same stack with every Stateless* class swapped back for the Django middleware it wraps.
+    stock = []
+    for path in middleware:
+        cls = import_string(path)
+        if issubclass(cls, StatelessSkipMixin):
+            base = cls.__mro__[2]
+            path = f'{base.__module__}.{base.__qualname__}'
+        stock.append(path)
+    return stock
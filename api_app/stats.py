@@ -0,0 +1,55 @@
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .counters import add_counts, bump, pending_daily_counts
+from .models import Promo, PromoCountryStat, PromoDailyStat
+from .ranking import ACTIVATION_WEIGHT, bump_ranks
+
+
+def record_activations(events):
+    daily = Counter((event.promo_id, timezone.localdate(event.created_at)) for event in events)
+    countries = Counter((event.promo_id, event.country) for event in events)
+    per_promo = Counter(event.promo_id for event in events)
+    for (promo_id, day), count in daily.items():
+        bump(PromoDailyStat, {'promo_id': promo_id, 'day': day}, activations=count)
+    for (promo_id, country), count in countries.items():
+        bump(PromoCountryStat, {'promo_id': promo_id, 'country': country}, activations=count)
+    Promo.objects.filter(id_promo__in=per_promo).update(used_count=F('used_count') + Case(
+        *[When(id_promo=promo_id, then=Value(count)) for promo_id, count in per_promo.items()],
+        output_field=IntegerField(),
+    ))
+    bump_ranks({promo_id: count * ACTIVATION_WEIGHT for promo_id, count in per_promo.items()})
+
+
+def record_like(promo_id, delta):
+    add_counts(promo_id, likes=delta)
+
+
+def record_comment(promo_id, delta):
+    add_counts(promo_id, comments=delta)
+
+
+def promo_stats(promo):
+    countries = (PromoCountryStat.objects.filter(promo=promo, activations__gt=0)
+                 .order_by('country').values_list('country', 'activations'))
+    daily = {day: {"date": day.isoformat(), "activations": activations, "likes": likes, "comments": comments}
+             for day, activations, likes, comments in PromoDailyStat.objects.filter(promo=promo)
+             .values_list('day', 'activations', 'likes', 'comments')}
+    like_count, comment_count = promo.like_count, promo.comment_count
+    for day, pending in pending_daily_counts(promo.id_promo).items():
+        row = daily.setdefault(day, {"date": day.isoformat(), "activations": 0, "likes": 0, "comments": 0})
+        row["likes"] += pending["likes"]
+        row["comments"] += pending["comments"]
+        like_count += pending["likes"]
+        comment_count += pending["comments"]
+    return {
+        "promo_id": str(promo.id_promo),
+        "company_id": str(promo.company_id),
+        "activations_count": promo.used_count,
+        "like_count": like_count,
+        "comment_count": comment_count,
+        "countries": [{"country": country, "activations_count": count} for country, count in countries],
+        "daily": [daily[day] for day in sorted(daily)],
+    }
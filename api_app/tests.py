@@ -1,3 +1,1741 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import warnings
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from . import urls
+from .cache import cache_stats
+from .codes import generate_codes
+from .counters import fold, with_counters
+from .events import ActivationLogWriter, activation_log
+from .metrics import MetricsRegistry, render_prometheus
+from .models import (ActivationEvent, Company, Promo, PromoActivation, PromoComment, PromoCounterShard, PromoCode,
+                     PromoDailyStat, PromoLike, User)
+from .ranking import sync_ranks
+from .routers import PrimaryReplicaRouter, check_pin_cache, pin_to_primary
+from .tokens import EntityRefreshToken, revoke_user_tokens
+from .views import PromoBatchView
+
+
+def create_promo(company, **kwargs):
+    data = dict(
+        company=company,
+        description='Promo',
+        image_url='https://example.com/promo.png',
+        target={},
+        max_count=10,
+        active_from=datetime.date(2025, 1, 1),
+        active_until=datetime.date(2030, 1, 1),
+        mode='COMMON',
+        promo_common='CODE',
+    )
+    data.update(kwargs)
+    promo = Promo(**data)
+    promo.sync_target_columns()
+    promo.save()
+    return promo
+
+
+def auth_client(entity):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {EntityRefreshToken.for_user(entity)}')
+    return client
+
+
+class PromoOutQueryCountTests(TestCase):
+    FEED_QUERIES = 3
+    BY_ID_QUERIES = 2
+    COMPANY_LIST_QUERIES = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def test_feed_query_count_does_not_depend_on_page_size(self):
+        promos = [create_promo(self.company) for _ in range(20)]
+        PromoLike.objects.create(user=self.user, promo=promos[0])
+        PromoActivation.objects.create(user=self.user, promo=promos[1])
+
+        with self.assertNumQueries(self.FEED_QUERIES):
+            response = self.client.get('/api/user/feed', {'limit': 1})
+        self.assertEqual(len(response.json()['data']), 1)
+
+        with self.assertNumQueries(self.FEED_QUERIES):
+            response = self.client.get('/api/user/feed', {'limit': 20})
+        data = response.json()['data']
+        self.assertEqual(len(data), 20)
+
+        flags = {item['promo_id']: (item['is_liked_by_user'], item['is_activated_by_user'])
+                 for item in data}
+        self.assertEqual(flags[str(promos[0].id_promo)], (True, False))
+        self.assertEqual(flags[str(promos[1].id_promo)], (False, True))
+        self.assertEqual(flags[str(promos[2].id_promo)], (False, False))
+        self.assertEqual(data[0]['company_name'], 'Company')
+
+    def test_promo_by_id_query_count(self):
+        promo = create_promo(self.company)
+        with self.assertNumQueries(self.BY_ID_QUERIES):
+            response = self.client.get(f'/api/user/promo/{promo.id_promo}')
+        self.assertEqual(response.data['company_id'], str(self.company.id))
+
+    def test_company_list_query_count_does_not_depend_on_page_size(self):
+        client = auth_client(self.company)
+        for _ in range(10):
+            create_promo(self.company)
+        with self.assertNumQueries(self.COMPANY_LIST_QUERIES):
+            client.get('/api/business/promo', {'limit': 1})
+        with self.assertNumQueries(self.COMPANY_LIST_QUERIES):
+            response = client.get('/api/business/promo', {'limit': 10})
+        self.assertEqual(len(response.json()), 10)
+
+
+class FastSerializationParityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Компания "\u2028"', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+        cls.promos = [
+            create_promo(cls.company, description='Скидка 10% \u2029 <b>"quoted"</b>\n\t\x01 😀'),
+            create_promo(cls.company, target={'country': 'ru', 'categories': ['еда', 'a\\b']},
+                         promo_common='\x7f \ud7ff \uffff'),
+            create_promo(cls.company, target={'age_from': 18, 'age_until': 99}, like_count=3),
+        ]
+        PromoLike.objects.create(user=cls.user, promo=cls.promos[0])
+        PromoActivation.objects.create(user=cls.user, promo=cls.promos[2])
+
+    def assertSameBytes(self, client, path, params):
+        with override_settings(API_FAST_SERIALIZATION=False):
+            expected = client.get(path, params)
+        with override_settings(API_FAST_SERIALIZATION=True):
+            actual = client.get(path, params)
+        self.assertEqual(expected.status_code, 200)
+        self.assertEqual(actual.status_code, 200)
+        self.assertEqual(actual.content, expected.content)
+        self.assertEqual(actual['Content-Type'], expected['Content-Type'])
+        self.assertEqual(actual.get('X-Total-Count'), expected.get('X-Total-Count'))
+        self.assertEqual(actual.get('X-Next-Cursor'), expected.get('X-Next-Cursor'))
+
+    def test_feed_matches_serializer_output(self):
+        client = auth_client(self.user)
+        self.assertSameBytes(client, '/api/user/feed', {'limit': 10})
+        self.assertSameBytes(client, '/api/user/feed', {'limit': 2, 'cursor': ''})
+
+    def test_company_list_matches_serializer_output(self):
+        client = auth_client(self.company)
+        self.assertSameBytes(client, '/api/business/promo', {'limit': 10})
+        self.assertSameBytes(client, '/api/business/promo', {'limit': 2, 'cursor': ''})
+
+    def test_company_list_with_float_target_matches_serializer_output(self):
+        create_promo(self.company, target={'score': 1e-7, 'ratio': 0.1 + 0.2, 'big': 1e22})
+        self.assertSameBytes(auth_client(self.company), '/api/business/promo', {'limit': 10})
+
+
+PASSWORD = 'Benchmark1!'
+
+ROUTE_QUERY_BUDGETS = {
+    ('ping', 'GET'): 0,
+    ('metrics', 'GET'): 0,
+    ('signup', 'POST'): 3,
+    ('signin', 'POST'): 5,
+    ('promo-list-create', 'GET'): 3,
+    ('promo-list-create', 'POST'): 3,
+    ('promo-batch', 'POST'): 11,
+    ('promo-detail', 'GET'): 2,
+    ('promo-detail', 'PATCH'): 6,
+    ('promo-codes', 'POST'): 7,
+    ('promo-stats', 'GET'): 5,
+    ('user-sign-up', 'POST'): 3,
+    ('user-login', 'POST'): 4,
+    ('profile', 'GET'): 3,
+    ('profile', 'PATCH'): 4,
+    ('user-feed', 'GET'): 4,
+    ('user-feed-by-id', 'GET'): 3,
+    ('user-promo-history', 'GET'): 2,
+    ('user-promo-like', 'POST'): 8,
+    ('user-promo-like', 'DELETE'): 8,
+    ('user-promo-comments', 'GET'): 4,
+    ('user-promo-comments', 'POST'): 10,
+    ('user-promo-comment-by-id', 'GET'): 3,
+    ('user-promo-comment-by-id', 'PUT'): 5,
+    ('user-promo-comment-by-id', 'DELETE'): 8,
+    ('user-promo-activate', 'POST'): 8,
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RouteBenchmarkTests(TestCase):
+    ITERATIONS = int(os.environ.get('API_BENCH_ITERATIONS', 5))
+    COMPANIES = 5
+    PROMOS_PER_COMPANY = 60
+    USERS = 100
+    COMMENTS = 200
+    HISTORY = 50
+    CODES = 500
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results and os.environ.get('API_BENCH'):
+            lines = [f"\n{'route':<40} {'queries':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+            for (name, method), (queries, samples) in sorted(cls.results.items()):
+                lines.append(f"{method + ' ' + name:<40} {queries:>7} {percentile(samples, 0.5):>8.2f} "
+                             f"{percentile(samples, 0.95):>8.2f} {max(samples):>8.2f}")
+            sys.stderr.write("\n".join(lines) + "\n")
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        password = make_password(PASSWORD)
+        cls.companies = [
+            Company.objects.create(name=f'Company {i}', email=f'company{i}@example.com', password=password)
+            for i in range(cls.COMPANIES)
+        ]
+        cls.company = cls.companies[0]
+        promos = []
+        for company in cls.companies:
+            for i in range(cls.PROMOS_PER_COMPANY):
+                promo = Promo(
+                    company=company,
+                    description=f'Promo {i} from {company.name}',
+                    image_url='https://example.com/promo.png',
+                    target={'country': ['ru', 'us', 'kz'][i % 3], 'age_from': 14, 'categories': ['food', 'travel']}
+                    if i % 2 else {},
+                    max_count=1_000_000,
+                    active_from=datetime.date(2025, 1, 1) + datetime.timedelta(days=i),
+                    active_until=datetime.date(2030, 1, 1),
+                    mode='UNIQUE' if i % 5 == 0 else 'COMMON',
+                    promo_common='' if i % 5 == 0 else f'CODE{i}',
+                    like_count=i,
+                )
+                promo.sync_target_columns()
+                promos.append(promo)
+        Promo.objects.bulk_create(promos)
+        cls.promo = next(promo for promo in promos
+                         if promo.company_id == cls.company.id and promo.mode == 'COMMON' and not promo.target)
+        cls.unique_promo = next(promo for promo in promos
+                                if promo.company_id == cls.company.id and promo.mode == 'UNIQUE')
+        cls.promos = promos
+        generate_codes(cls.unique_promo, cls.CODES)
+
+        cls.users = [
+            User.objects.create(name=f'User {i}', surname='Bench', email=f'user{i}@example.com', password=password,
+                                other={'age': 20 + i % 40, 'country': ['ru', 'us', 'kz'][i % 3]})
+            for i in range(cls.USERS)
+        ]
+        PromoLike.objects.bulk_create([
+            PromoLike(user=user, promo=promo) for user in cls.users for promo in promos[:cls.ITERATIONS]
+        ])
+        cls.user = cls.users[0]
+        PromoActivation.objects.bulk_create([
+            PromoActivation(user=cls.user, promo=promo) for promo in promos[:cls.HISTORY]
+        ])
+        cls.comments = PromoComment.objects.bulk_create([
+            PromoComment(promo=cls.promo, author=cls.users[i % cls.USERS], text=f'Comment {i}')
+            for i in range(cls.COMMENTS)
+        ])
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.company_client = auth_client(self.company)
+        self.user_client = auth_client(self.user)
+
+    def measure(self, name, method, request, expected_status=200):
+        cache.clear()
+        queries, samples = 0, []
+        for i in range(self.ITERATIONS):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request(i)
+                samples.append((time.perf_counter() - start) * 1000)
+            self.assertEqual(response.status_code, expected_status, response.content[:500])
+            queries = max(queries, len(captured))
+        self.results[(name, method)] = (queries, samples)
+        budget = ROUTE_QUERY_BUDGETS[(name, method)]
+        self.assertLessEqual(queries, budget, f"{method} {name} ran {queries} queries, budget is {budget}")
+
+    def promo_payload(self, i):
+        return {
+            'description': f'Benchmark promo {i}',
+            'image_url': 'https://example.com/promo.png',
+            'target': {'country': 'ru', 'age_from': 18, 'categories': ['food']},
+            'max_count': 100,
+            'active_from': '2025-01-01',
+            'active_until': '2030-01-01',
+            'mode': 'COMMON',
+            'promo_common': f'BENCH{i}',
+        }
+
+    def test_every_route_has_a_budget(self):
+        routes = set()
+        for pattern in urls.urlpatterns:
+            view = pattern.callback.view_class
+            for method in ('get', 'post', 'put', 'patch', 'delete'):
+                if hasattr(view, method):
+                    routes.add((pattern.name, method.upper()))
+        self.assertEqual(routes, set(ROUTE_QUERY_BUDGETS))
+
+    def test_ping(self):
+        self.measure('ping', 'GET', lambda i: self.anonymous.get('/api/ping'))
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics(self):
+        self.measure('metrics', 'GET', lambda i: self.anonymous.get('/api/metrics'))
+
+    def test_company_sign_up(self):
+        self.measure('signup', 'POST', lambda i: self.anonymous.post('/api/business/auth/sign-up', {
+            'name': 'New company', 'email': f'new-company{i}@example.com', 'password': PASSWORD,
+        }, format='json'))
+
+    def test_company_sign_in(self):
+        self.measure('signin', 'POST', lambda i: self.anonymous.post('/api/business/auth/sign-in', {
+            'email': self.company.email, 'password': PASSWORD,
+        }, format='json'))
+
+    def test_company_promo_list(self):
+        self.measure('promo-list-create', 'GET',
+                     lambda i: self.company_client.get('/api/business/promo', {'limit': 20}))
+
+    def test_company_promo_create(self):
+        self.measure('promo-list-create', 'POST',
+                     lambda i: self.company_client.post('/api/business/promo', self.promo_payload(i), format='json'),
+                     expected_status=201)
+
+    def test_company_promo_batch(self):
+        ids = [str(promo.id_promo) for promo in self.promos if promo.company_id == self.company.id]
+        self.measure('promo-batch', 'POST', lambda i: self.company_client.post('/api/business/promo/batch', {
+            'create': [self.promo_payload(i * 10 + j) for j in range(10)],
+            'update': [{'id': ids[j], 'description': f'Updated {i}'} for j in range(10)],
+            'deactivate': ids[10:15],
+            'reactivate': ids[10:15],
+        }, format='json'))
+
+    def test_company_promo_detail(self):
+        self.measure('promo-detail', 'GET',
+                     lambda i: self.company_client.get(f'/api/business/promo/{self.promo.id_promo}'))
+
+    def test_company_promo_patch(self):
+        self.measure('promo-detail', 'PATCH', lambda i: self.company_client.patch(
+            f'/api/business/promo/{self.promo.id_promo}', {'description': f'Patched {i}'}, format='json'))
+
+    def test_company_promo_codes(self):
+        self.measure('promo-codes', 'POST', lambda i: self.company_client.post(
+            f'/api/business/promo/{self.unique_promo.id_promo}/codes?generate=100'))
+
+    def test_company_promo_stats(self):
+        self.measure('promo-stats', 'GET',
+                     lambda i: self.company_client.get(f'/api/business/promo/{self.promo.id_promo}/stat'))
+
+    def test_user_sign_up(self):
+        self.measure('user-sign-up', 'POST', lambda i: self.anonymous.post('/api/user/auth/sign-up', {
+            'name': 'New', 'surname': 'User', 'email': f'new-user{i}@example.com', 'password': PASSWORD,
+            'avatar_url': 'https://example.com/avatar.png', 'other': {'age': 25, 'country': 'ru'},
+        }, format='json'), expected_status=201)
+
+    def test_user_sign_in(self):
+        self.measure('user-login', 'POST', lambda i: self.anonymous.post('/api/user/auth/sign-in', {
+            'email': self.user.email, 'password': PASSWORD,
+        }, format='json'))
+
+    def test_user_profile(self):
+        self.measure('profile', 'GET', lambda i: self.user_client.get('/api/user/profile'))
+
+    def test_user_profile_patch(self):
+        self.measure('profile', 'PATCH', lambda i: self.user_client.patch(
+            '/api/user/profile', {'name': f'Renamed {i}'}, format='json'))
+
+    def test_user_feed(self):
+        self.measure('user-feed', 'GET', lambda i: self.user_client.get('/api/user/feed', {'limit': 20}))
+
+    def test_user_promo(self):
+        self.measure('user-feed-by-id', 'GET',
+                     lambda i: self.user_client.get(f'/api/user/promo/{self.promos[i].id_promo}'))
+
+    def test_user_promo_history(self):
+        self.measure('user-promo-history', 'GET',
+                     lambda i: self.user_client.get('/api/user/promo/history', {'limit': 20}))
+
+    def test_user_promo_like(self):
+        client = auth_client(self.users[1])
+        self.measure('user-promo-like', 'POST',
+                     lambda i: client.post(f'/api/user/promo/{self.promos[-1 - i].id_promo}/like'))
+
+    def test_user_promo_unlike(self):
+        self.measure('user-promo-like', 'DELETE',
+                     lambda i: self.user_client.delete(f'/api/user/promo/{self.promos[i].id_promo}/like'))
+
+    def test_user_promo_comments(self):
+        self.measure('user-promo-comments', 'GET', lambda i: self.user_client.get(
+            f'/api/user/promo/{self.promo.id_promo}/comments', {'limit': 20}))
+
+    def test_user_promo_comment_create(self):
+        self.measure('user-promo-comments', 'POST', lambda i: self.user_client.post(
+            f'/api/user/promo/{self.promo.id_promo}/comments', {'text': f'Comment {i}'}, format='json'),
+            expected_status=201)
+
+    def test_user_promo_comment(self):
+        self.measure('user-promo-comment-by-id', 'GET', lambda i: self.user_client.get(
+            f'/api/user/promo/{self.promo.id_promo}/comments/{self.comments[i].comment_id}'))
+
+    def test_user_promo_comment_update(self):
+        self.measure('user-promo-comment-by-id', 'PUT', lambda i: self.user_client.put(
+            f'/api/user/promo/{self.promo.id_promo}/comments/{self.comments[i].comment_id}',
+            {'text': f'Edited {i}'}, format='json'))
+
+    def test_user_promo_comment_delete(self):
+        self.measure('user-promo-comment-by-id', 'DELETE', lambda i: self.user_client.delete(
+            f'/api/user/promo/{self.promo.id_promo}/comments/{self.comments[i].comment_id}'))
+
+    def test_user_promo_activate(self):
+        self.measure('user-promo-activate', 'POST', lambda i: auth_client(self.users[i]).post(
+            f'/api/user/promo/{self.promo.id_promo}/activate'))
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+class MetricsTests(TestCase):
+
+    def test_middleware_records_view_metrics(self):
+        company = Company.objects.create(name='Company', email='company@example.com')
+        create_promo(company)
+        client = auth_client(company)
+        client.get('/api/business/promo')
+        client.get('/api/business/promo/not-a-uuid')
+
+        body = client.get('/api/metrics').content.decode()
+        labels = 'view="api_app:promo-list-create",method="GET"'
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}}', body)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}}', body)
+        self.assertIn(f'api_responses_total{{{labels},status="200"}}', body)
+        self.assertIn('api_responses_total{view="unmatched",method="GET",status="404"}', body)
+        queries = next(line for line in body.splitlines() if line.startswith(f'api_db_queries_total{{{labels}}}'))
+        self.assertGreater(int(queries.split()[-1]), 0)
+
+    def test_collect_sums_worker_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = MetricsRegistry(directory=directory)
+            registry.observe('api_app:user-feed', 'GET', 200, 0.02, 3, 0.004, 100)
+            other = MetricsRegistry(directory=directory)
+            other.observe('api_app:user-feed', 'GET', 200, 0.3, 4, 0.01, 200)
+            other.observe('api_app:user-feed', 'GET', 400, 0.001, 1, 0.001, 50)
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as f:
+                json.dump(other.snapshot(), f)
+
+            body = render_prometheus(registry.collect())
+        labels = 'view="api_app:user-feed",method="GET"'
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="0.025"}} 2', body)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="0.25"}} 2', body)
+        self.assertIn(f'api_request_duration_seconds_bucket{{{labels},le="0.5"}} 3', body)
+        self.assertIn(f'api_request_duration_seconds_count{{{labels}}} 3', body)
+        self.assertIn(f'api_db_queries_total{{{labels}}} 8', body)
+        self.assertIn(f'api_response_size_bytes_total{{{labels}}} 350', body)
+        self.assertIn(f'api_responses_total{{{labels},status="200"}} 2', body)
+        self.assertIn(f'api_responses_total{{{labels},status="400"}} 1', body)
+
+    def test_cache_lookups_are_exported(self):
+        company = Company.objects.create(name='Company', email='company@example.com')
+        promo = create_promo(company)
+        client = auth_client(company)
+        before = cache_stats()
+        client.get(f'/api/business/promo/{promo.id_promo}')
+        client.get(f'/api/business/promo/{promo.id_promo}')
+
+        body = client.get('/api/metrics').content.decode()
+        self.assertIn(f'api_promo_cache_requests_total{{result="hits"}} {before["hits"] + 1}', body)
+        self.assertIn(f'api_promo_cache_requests_total{{result="misses"}} {before["misses"] + 1}', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret', METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_scrape_needs_the_token_or_an_allowed_address(self):
+        self.assertEqual(APIClient().get('/api/metrics').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(APIClient().get('/api/metrics', HTTP_X_FORWARDED_FOR='10.0.0.5').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code,
+                         200)
+        for header in ('Bearer wrong', 'scrape-secret', 'Bearer scrape-secret2'):
+            self.assertEqual(APIClient().get('/api/metrics', HTTP_AUTHORIZATION=header).status_code, 403)
+        company = Company.objects.create(name='Company', email='company@example.com')
+        self.assertEqual(auth_client(company).get('/api/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN=None, METRICS_ALLOWED_IPS=[])
+    def test_scrape_is_closed_without_configuration(self):
+        self.assertEqual(APIClient().get('/api/metrics').status_code, 403)
+        self.assertEqual(APIClient().get('/api/metrics', HTTP_AUTHORIZATION='Bearer None').status_code, 403)
+
+    def test_pool_saturation_metrics(self):
+        body = render_prometheus({"requests": {}, "statuses": {}, "pools": {"default": {
+            "pool_max": 10, "pool_size": 10, "pool_available": 0, "requests_waiting": 4, "requests_wait_ms": 1500,
+        }}})
+        self.assertIn('api_db_pool_size{alias="default"} 10', body)
+        self.assertIn('api_db_pool_available{alias="default"} 0', body)
+        self.assertIn('api_db_pool_requests_waiting{alias="default"} 4', body)
+        self.assertIn('api_db_pool_requests_wait_seconds_total{alias="default"} 1.5', body)
+        self.assertIn('api_db_pool_requests_errors_total{alias="default"} 0', body)
+
+
+class TokenRevocationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        cls.other = User.objects.create(name='Other', surname='Test', email='other@example.com')
+
+    def setUp(self):
+        cache.clear()
+
+    def expire(self, tokens):
+        jtis = [token[api_settings.JTI_CLAIM] for token in tokens]
+        OutstandingToken.objects.filter(jti__in=jtis).update(expires_at=timezone.now() - datetime.timedelta(days=1))
+
+    def test_revocation_blacklists_every_outstanding_token(self):
+        tokens = [EntityRefreshToken.for_user(self.user) for _ in range(3)]
+        other_token = EntityRefreshToken.for_user(self.other)
+        with self.assertNumQueries(2):
+            self.assertEqual(revoke_user_tokens(self.user), 3)
+        self.assertEqual(revoke_user_tokens(self.user), 0)
+
+        self.assertEqual(set(BlacklistedToken.objects.values_list('token__jti', flat=True)),
+                         {token[api_settings.JTI_CLAIM] for token in tokens})
+        for token in tokens:
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(client.get('/api/user/profile').status_code, 401)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {other_token}')
+        self.assertEqual(client.get('/api/user/profile').status_code, 200)
+
+    def test_prune_deletes_only_expired_tokens_in_batches(self):
+        expired_revoked = [EntityRefreshToken.for_user(self.user) for _ in range(2)]
+        expired = [EntityRefreshToken.for_user(self.user) for _ in range(3)]
+        live_revoked = EntityRefreshToken.for_user(self.other)
+        revoke_user_tokens(self.user)
+        revoke_user_tokens(self.other)
+        live = EntityRefreshToken.for_user(self.other)
+        BlacklistedToken.objects.filter(token__jti__in=[token[api_settings.JTI_CLAIM] for token in expired]).delete()
+        self.expire(expired_revoked + expired)
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as captured:
+            call_command('prune_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn('Deleted 2 blacklisted and 5 outstanding tokens.', out.getvalue())
+        self.assertEqual(set(OutstandingToken.objects.values_list('jti', flat=True)),
+                         {live_revoked[api_settings.JTI_CLAIM], live[api_settings.JTI_CLAIM]})
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)),
+                         [live_revoked[api_settings.JTI_CLAIM]])
+        batches = [query for query in captured if 'LIMIT' in query['sql']]
+        # 1 full batch of blacklisted tokens, then 3 of outstanding, each followed by one empty lookup.
+        self.assertEqual(len(batches), 1 + 1 + 3 + 1)
+
+
+class RetargetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+        cls.promo = create_promo(cls.company, target={'country': 'us', 'age_from': 30, 'categories': ['travel']})
+
+    def setUp(self):
+        cache.clear()
+        self.company_client = auth_client(self.company)
+        self.user_client = auth_client(self.user)
+
+    def columns(self):
+        self.promo.refresh_from_db()
+        return (self.promo.target_country, self.promo.target_age_from, self.promo.target_age_until,
+                self.promo.target_categories)
+
+    def feed_ids(self, **params):
+        response = self.user_client.get('/api/user/feed', params)
+        self.assertEqual(response.status_code, 200)
+        return [item['promo_id'] for item in response.json()['data']]
+
+    def assert_targeted(self, columns, eligible):
+        self.assertEqual(self.columns(), columns)
+        promo_id = str(self.promo.id_promo)
+        self.assertEqual(self.feed_ids(eligible='true'), [promo_id] if eligible else [])
+        self.assertEqual(self.feed_ids(category='food'), [promo_id] if 'food' in columns[3] else [])
+
+    def test_patch_retargets(self):
+        self.assert_targeted(('us', 30, None, ['travel']), eligible=False)
+        response = self.company_client.patch(f'/api/business/promo/{self.promo.id_promo}', {
+            'target': {'country': 'RU', 'age_from': 18, 'age_until': 25, 'categories': ['Food']},
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_targeted(('ru', 18, 25, ['food']), eligible=True)
+
+        response = self.company_client.patch(f'/api/business/promo/{self.promo.id_promo}',
+                                             {'target': {'age_until': 19}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_targeted((None, None, 19, []), eligible=False)
+
+    def test_batch_update_retargets(self):
+        def retarget(target):
+            response = self.company_client.post('/api/business/promo/batch', {
+                'create': [], 'update': [{'id': str(self.promo.id_promo), 'target': target}],
+                'deactivate': [], 'reactivate': [],
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('id', response.json()['updated'][0])
+
+        retarget({'country': 'Ru', 'age_until': 20, 'categories': ['food', 'Travel']})
+        self.assert_targeted(('ru', None, 20, ['food', 'travel']), eligible=True)
+        retarget({'country': 'kz'})
+        self.assert_targeted(('kz', None, None, []), eligible=False)
+
+
+class PromoUpdateRaceTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.promos = [create_promo(cls.company, description=f'Promo {i}') for i in range(2)]
+
+    def setUp(self):
+        self.client = auth_client(self.company)
+
+    def bump_counters_on_update(self):
+        # Simulates likes, activations and claims landing between loading a promo and saving it.
+        original = Promo.sync_target_columns
+
+        def sync_target_columns(promo):
+            Promo.objects.filter(id_promo=promo.id_promo).update(
+                like_count=F('like_count') + 1, used_count=F('used_count') + 1, max_count=F('max_count') - 1)
+            original(promo)
+        return mock.patch.object(Promo, 'sync_target_columns', autospec=True, side_effect=sync_target_columns)
+
+    def counters(self, promo):
+        promo.refresh_from_db()
+        return promo.like_count, promo.used_count, promo.max_count
+
+    def test_patch_keeps_concurrent_counter_writes(self):
+        promo = self.promos[0]
+        with self.bump_counters_on_update():
+            response = self.client.patch(f'/api/business/promo/{promo.id_promo}',
+                                         {'description': 'Updated', 'target': {'country': 'RU'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(promo), (1, 1, 9))
+        self.assertEqual((promo.description, promo.target_country), ('Updated', 'ru'))
+
+    def test_batch_update_keeps_concurrent_counter_writes(self):
+        first, second = self.promos
+        with self.bump_counters_on_update():
+            response = self.client.post('/api/business/promo/batch', {
+                'create': [], 'deactivate': [], 'reactivate': [],
+                'update': [{'id': str(first.id_promo), 'description': 'Updated'},
+                           {'id': str(second.id_promo), 'max_count': 50}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(first), (1, 1, 9))
+        self.assertEqual(first.description, 'Updated')
+        self.assertEqual(self.counters(second), (1, 1, 50))
+        self.assertEqual(second.description, 'Promo 1')
+
+
+class PromoBatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.other_company = Company.objects.create(name='Other', email='other@example.com')
+        cls.promos = [create_promo(cls.company, description=f'Promo {i}') for i in range(3)]
+        cls.foreign = create_promo(cls.other_company)
+
+    def setUp(self):
+        self.client = auth_client(self.company)
+
+    def batch(self, **parts):
+        return self.client.post('/api/business/promo/batch', dict({
+            'create': [], 'update': [], 'deactivate': [], 'reactivate': [],
+        }, **parts), format='json')
+
+    def payload(self, **kwargs):
+        return dict({
+            'description': 'New promo',
+            'image_url': 'https://example.com/promo.png',
+            'target': {'country': 'RU'},
+            'max_count': 5,
+            'active_from': '2025-01-01',
+            'active_until': '2030-01-01',
+            'mode': 'COMMON',
+            'promo_common': 'NEW',
+        }, **kwargs)
+
+    def test_invalid_items_are_reported_per_index(self):
+        first, second, third = self.promos
+        response = self.batch(
+            create=[self.payload(), self.payload(target='ru'), self.payload(target=[1]), 'nope',
+                    self.payload(description='Second new', mode='UNIQUE', promo_unique=['a', 'b', 'a'])],
+            update=[{'id': str(first.id_promo), 'description': 'Updated', 'target': {'country': 'US'}},
+                    {'id': str(second.id_promo), 'target': 'us'},
+                    {'id': str(third.id_promo), 'max_count': 'many'},
+                    {'id': str(self.foreign.id_promo), 'description': 'Stolen'},
+                    {'id': 'not-a-uuid'}, 42],
+            deactivate=[str(third.id_promo), str(self.foreign.id_promo), 'not-a-uuid', str(uuid.uuid4())],
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual([sorted(item) for item in body['created']],
+                         [['id', 'index'], ['errors', 'index'], ['errors', 'index'], ['errors', 'index'],
+                          ['id', 'index']])
+        self.assertIn('target', body['created'][1]['errors'])
+        self.assertEqual([sorted(item) for item in body['updated']],
+                         [['id', 'index']] + [['errors', 'index']] * 5)
+        self.assertIn('target', body['updated'][1]['errors'])
+        self.assertEqual(body['deactivated'][0], {'index': 0, 'id': str(third.id_promo)})
+        self.assertEqual([item['errors'] for item in body['deactivated'][1:]], [{'id': ['Promo not found.']}] * 3)
+        self.assertEqual(body['reactivated'], [])
+
+        created = Promo.objects.get(id_promo=body['created'][4]['id'])
+        self.assertEqual(sorted(created.codes.values_list('code', flat=True)), ['a', 'b'])
+        self.assertEqual(Promo.objects.get(id_promo=body['created'][0]['id']).target_country, 'ru')
+        first.refresh_from_db()
+        self.assertEqual((first.description, first.target_country), ('Updated', 'us'))
+        second.refresh_from_db()
+        self.assertEqual(second.target, {})
+        third.refresh_from_db()
+        self.assertEqual((third.max_count, third.active), (10, False))
+        self.foreign.refresh_from_db()
+        self.assertEqual((self.foreign.description, self.foreign.active), ('Promo', True))
+
+    def test_set_active_invalidates_only_owned_promos(self):
+        first = self.promos[0]
+        with mock.patch('api_app.batch.invalidate_promos') as invalidate:
+            response = self.batch(reactivate=[str(first.id_promo), str(self.foreign.id_promo), str(uuid.uuid4())])
+        self.assertEqual(response.status_code, 200)
+        invalidate.assert_called_with({first.id_promo})
+        self.assertEqual([sorted(item) for item in response.json()['reactivated']],
+                         [['id', 'index'], ['errors', 'index'], ['errors', 'index']])
+
+    def test_item_count_limit(self):
+        ids = [str(promo.id_promo) for promo in self.promos]
+        with mock.patch.object(PromoBatchView, 'max_items', 4):
+            response = self.batch(create=[self.payload()], update=[], deactivate=ids, reactivate=ids[:1])
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['message'], 'At most 4 items per batch.')
+            self.assertEqual(Promo.objects.count(), 4)
+            self.assertEqual(self.batch(deactivate=ids, reactivate=ids[:1]).status_code, 200)
+
+    def test_body_must_be_an_object_of_lists(self):
+        self.assertEqual(self.client.post('/api/business/promo/batch', [1], format='json').status_code, 400)
+        self.assertEqual(self.batch(create={'description': 'x'}).status_code, 400)
+
+
+class PromoStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.other_company = Company.objects.create(name='Other', email='other@example.com')
+        cls.promo = create_promo(cls.company)
+        cls.users = [User.objects.create(name='User', surname='Test', email=f'user{i}@example.com',
+                                         other={'age': 20, 'country': country})
+                     for i, country in enumerate(('ru', 'RU', 'kz'))]
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/api/business/promo/{self.promo.id_promo}/stat'
+
+    def test_payload_counts_and_countries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user in self.users:
+                auth_client(user).post(f'/api/user/promo/{self.promo.id_promo}/activate')
+        activation_log.flush()
+        for user in self.users[:2]:
+            auth_client(user).post(f'/api/user/promo/{self.promo.id_promo}/like')
+        auth_client(self.users[2]).post(f'/api/user/promo/{self.promo.id_promo}/comments', {'text': 'Hi'},
+                                        format='json')
+
+        response = auth_client(self.company).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        today = timezone.localdate().isoformat()
+        self.assertEqual(response.json(), {
+            "promo_id": str(self.promo.id_promo),
+            "company_id": str(self.company.id),
+            "activations_count": 3,
+            "like_count": 2,
+            "comment_count": 1,
+            "countries": [{"country": "kz", "activations_count": 1}, {"country": "ru", "activations_count": 2}],
+            "daily": [{"date": today, "activations": 3, "likes": 2, "comments": 1}],
+        })
+        fold()
+        cache.clear()
+        self.assertEqual(auth_client(self.company).get(self.url).json()['daily'],
+                         [{"date": today, "activations": 3, "likes": 2, "comments": 1}])
+
+    def test_other_company_gets_404(self):
+        client = auth_client(self.other_company)
+        for _ in range(2):
+            response = client.get(self.url)
+            self.assertEqual(response.status_code, 404)
+        self.assertEqual(auth_client(self.company).get(self.url).status_code, 200)
+        self.assertEqual(client.get('/api/business/promo/00000000-0000-0000-0000-000000000000/stat').status_code, 404)
+
+
+class ActivationLogWriterTests(TestCase):
+
+    def setUp(self):
+        self.writes = []
+        self.written = threading.Event()
+        self.failing = {}
+
+    def writer(self, **kwargs):
+        writer = ActivationLogWriter(**kwargs)
+        self.addCleanup(writer.flush)
+        patcher = mock.patch.object(writer, '_write', side_effect=self.write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return writer
+
+    def write(self, events):
+        for event in events:
+            if event.code in self.failing:
+                raise self.failing[event.code]('boom')
+        self.writes.append(([event.code for event in events], threading.current_thread()))
+        self.written.set()
+
+    def event(self, code):
+        return ActivationEvent(promo_id=uuid.uuid4(), user_id=uuid.uuid4(), code=code, country='ru')
+
+    def test_full_buffer_is_flushed_in_the_background(self):
+        writer = self.writer(batch_size=3, flush_interval=60)
+        writer.add(self.event('a'))
+        writer.add(self.event('b'))
+        self.assertEqual((writer.pending(), self.writes), (2, []))
+        writer.add(self.event('c'))
+        self.assertTrue(self.written.wait(5))
+        [(codes, thread)] = self.writes
+        self.assertEqual(codes, ['a', 'b', 'c'])
+        self.assertIsNot(thread, threading.current_thread())
+        self.assertEqual(writer.pending(), 0)
+
+    def test_partial_buffer_is_flushed_after_the_interval(self):
+        writer = self.writer(batch_size=100, flush_interval=0.05)
+        writer.add(self.event('a'))
+        self.assertTrue(self.written.wait(5))
+        self.assertEqual(self.writes[0][0], ['a'])
+
+    def test_flush_on_shutdown(self):
+        with mock.patch('atexit.register') as register:
+            writer = self.writer(batch_size=100, flush_interval=60)
+        register.assert_called_once_with(writer.flush)
+        writer.add(self.event('a'))
+        writer.add(self.event('b'))
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(self.writes[0][0], ['a', 'b'])
+
+    def test_poison_event_is_dropped_after_max_attempts(self):
+        writer = self.writer(batch_size=100, flush_interval=60, max_attempts=2)
+        self.failing['bad'] = IntegrityError
+        for code in ('a', 'bad', 'b'):
+            writer.add(self.event(code))
+        with self.assertLogs('api_app.events', 'ERROR'):
+            self.assertEqual(writer.flush(), 2)
+        self.assertEqual([codes for codes, _ in self.writes], [['a'], ['b']])
+        self.assertEqual(writer.pending(), 1)
+
+        writer.add(self.event('c'))
+        with self.assertLogs('api_app.events', 'ERROR') as logs:
+            self.assertEqual(writer.flush(), 1)
+        self.assertTrue(any('Dropping activation event' in line for line in logs.output))
+        self.assertEqual(self.writes[-1][0], ['c'])
+        self.assertEqual(writer.pending(), 0)
+
+    def test_unreachable_database_keeps_events_queued(self):
+        writer = self.writer(batch_size=100, flush_interval=60, max_attempts=2, max_backoff=200)
+        self.failing.update(a=OperationalError, b=OperationalError)
+        for code in ('a', 'b'):
+            writer.add(self.event(code))
+        for backoff in (60, 120, 200, 200):
+            with self.assertLogs('api_app.events', 'ERROR') as logs:
+                self.assertEqual(writer.flush(), 0)
+            self.assertFalse(any('Dropping activation event' in line for line in logs.output))
+            self.assertEqual((writer.pending(), writer._backoff, writer._timer.interval), (2, backoff, backoff))
+
+        writer.add(self.event('c'))
+        self.assertEqual(writer._timer.interval, 200)
+        self.failing.clear()
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(self.writes[-1][0], ['a', 'b', 'c'])
+        self.assertEqual((writer.pending(), writer._backoff), (0, 0))
+
+    def test_failed_write_does_not_fail_the_activation(self):
+        company = Company.objects.create(name='Company', email='company@example.com')
+        promo = create_promo(company)
+        user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        with mock.patch.object(activation_log, 'add', side_effect=DatabaseError('boom')), \
+                self.assertLogs('django', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = auth_client(user).post(f'/api/user/promo/{promo.id_promo}/activate')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(PromoActivation.objects.filter(user=user, promo=promo).exists())
+
+
+class ConditionalResponseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+        cls.fan = User.objects.create(name='Fan', surname='Test', email='fan@example.com')
+        cls.promo = create_promo(cls.company, target={'country': 'ru'})
+
+    def setUp(self):
+        cache.clear()
+        self.client = auth_client(self.user)
+
+    def revalidate(self, url, **params):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        return lambda: self.client.get(url, params, HTTP_IF_NONE_MATCH=first['ETag']).status_code
+
+    def test_unchanged_feed_is_not_modified(self):
+        again = self.revalidate('/api/user/feed')
+        self.assertEqual(again(), 304)
+        self.assertEqual(self.client.get('/api/user/feed', {'limit': 5}, HTTP_IF_NONE_MATCH='"other"').status_code,
+                         200)
+
+    def test_promo_writes_invalidate_the_feed(self):
+        again = self.revalidate('/api/user/feed')
+        response = auth_client(self.company).patch(f'/api/business/promo/{self.promo.id_promo}',
+                                                   {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(again(), 200)
+
+        again = self.revalidate('/api/user/feed')
+        create_promo(self.company)
+        self.assertEqual(again(), 304)
+        auth_client(self.company).post('/api/business/promo/batch', {
+            'create': [], 'update': [], 'deactivate': [str(self.promo.id_promo)], 'reactivate': [],
+        }, format='json')
+        self.assertEqual(again(), 200)
+
+    def test_counter_writes_keep_the_feed_until_max_age(self):
+        feed = self.revalidate('/api/user/feed')
+        detail = self.revalidate(f'/api/user/promo/{self.promo.id_promo}')
+        auth_client(self.fan).post(f'/api/user/promo/{self.promo.id_promo}/like')
+        self.assertEqual((feed(), detail()), (304, 200))
+
+        later = time.time() + settings.FEED_MAX_AGE
+        with mock.patch('api_app.conditional.time', mock.Mock(time=lambda: later, time_ns=time.time_ns)):
+            self.assertEqual(feed(), 200)
+
+    def test_own_like_invalidates_the_feed(self):
+        again = self.revalidate('/api/user/feed')
+        self.client.post(f'/api/user/promo/{self.promo.id_promo}/like')
+        self.assertEqual(again(), 200)
+        self.assertTrue(self.client.get('/api/user/feed').json()['data'][0]['is_liked_by_user'])
+
+    def test_profile_change_invalidates_the_eligible_feed(self):
+        again = self.revalidate('/api/user/feed', eligible='true')
+        self.assertEqual(again(), 304)
+        response = self.client.patch('/api/user/profile', {'other': {'age': 20, 'country': 'us'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(again(), 200)
+        self.assertEqual(self.client.get('/api/user/feed', {'eligible': 'true'}).json()['data'], [])
+
+
+class PromoCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        cls.promo = create_promo(cls.company)
+
+    def setUp(self):
+        cache.clear()
+        self.company_client = auth_client(self.company)
+        self.user_client = auth_client(self.user)
+        self.company_url = f'/api/business/promo/{self.promo.id_promo}'
+        self.user_url = f'/api/user/promo/{self.promo.id_promo}'
+
+    def get(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response['X-Cache'], response.json()
+
+    def test_promo_update_invalidates_cached_payloads(self):
+        self.assertEqual(self.get(self.company_client, self.company_url)[0], 'MISS')
+        self.assertEqual(self.get(self.company_client, self.company_url)[0], 'HIT')
+        self.get(self.user_client, self.user_url)
+
+        response = self.company_client.patch(self.company_url, {'description': 'Updated'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        for client, url in ((self.company_client, self.company_url), (self.user_client, self.user_url)):
+            hit, body = self.get(client, url)
+            self.assertEqual((hit, body['description']), ('MISS', 'Updated'))
+
+    def test_like_invalidates_cached_payloads(self):
+        self.get(self.user_client, self.user_url)
+        self.assertEqual(self.get(self.user_client, self.user_url)[0], 'HIT')
+        self.get(self.company_client, self.company_url)
+
+        self.assertEqual(self.user_client.post(f'{self.user_url}/like').status_code, 200)
+        hit, body = self.get(self.user_client, self.user_url)
+        self.assertEqual((hit, body['like_count'], body['is_liked_by_user']), ('MISS', 1, True))
+        hit, body = self.get(self.company_client, self.company_url)
+        self.assertEqual((hit, body['like_count']), ('MISS', 1))
+
+        self.user_client.delete(f'{self.user_url}/like')
+        self.assertEqual(self.get(self.user_client, self.user_url)[1]['like_count'], 0)
+
+
+@skipUnless('replica' in settings.DATABASE_REPLICAS, "needs a 'replica' alias, see settings_test")
+class ReplicaRouterTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Company', email='company@example.com')
+        self.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                        other={'age': 20, 'country': 'ru'})
+        self.promo = create_promo(self.company)
+
+    def reads(self, alias, request):
+        with CaptureQueriesContext(connections[alias]) as captured:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in captured if query['sql'].lstrip().upper().startswith('SELECT')]
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Promo), 'replica')
+        self.assertEqual(router.db_for_write(Promo), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Promo), 'default')
+
+    def test_user_reads_own_writes_after_like(self):
+        client, other = auth_client(self.user), auth_client(
+            User.objects.create(name='Other', surname='Test', email='other@example.com'))
+        self.assertTrue(self.reads('replica', lambda: client.get('/api/user/feed')))
+
+        with CaptureQueriesContext(connections['replica']) as captured:
+            client.post(f'/api/user/promo/{self.promo.id_promo}/like')
+        self.assertEqual(len(captured), 0)
+
+        self.assertFalse(self.reads('replica', lambda: client.get('/api/user/feed')))
+        self.assertTrue(self.reads('default', lambda: client.get('/api/user/feed')))
+        self.assertTrue(self.reads('replica', lambda: other.get('/api/user/feed')))
+
+    def test_pin_written_by_another_worker_is_honoured(self):
+        client = auth_client(self.user)
+        self.assertTrue(self.reads('replica', lambda: client.get('/api/user/feed')))
+        # Another worker handled the write: all this process shares with it is the cache.
+        pin_to_primary(self.user.id)
+        self.assertFalse(self.reads('replica', lambda: client.get('/api/user/feed')))
+
+    def test_per_process_pin_cache_is_flagged(self):
+        self.assertEqual([warning.id for warning in check_pin_cache(None)], ['api_app.W001'])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(check_pin_cache(None), [])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(check_pin_cache(None), [])
+
+    @override_settings(REPLICA_PIN_SECONDS=0.2)
+    def test_pin_expires(self):
+        client = auth_client(self.user)
+        client.post(f'/api/user/promo/{self.promo.id_promo}/comments', {'text': 'Hi'}, format='json')
+        self.assertFalse(self.reads('replica', lambda: client.get('/api/user/feed')))
+        time.sleep(0.3)
+        self.assertTrue(self.reads('replica', lambda: client.get('/api/user/feed')))
+
+
+class FeedSortTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+
+    def setUp(self):
+        cache.clear()
+        self.client = auth_client(self.user)
+        self.company_client = auth_client(self.company)
+
+    def create(self, **kwargs):
+        response = self.company_client.post('/api/business/promo', dict({
+            'description': 'Promo',
+            'image_url': 'https://example.com/promo.png',
+            'target': {},
+            'max_count': 10,
+            'active_from': '2025-01-01',
+            'active_until': '2030-01-01',
+            'mode': 'COMMON',
+            'promo_common': 'CODE',
+        }, **kwargs), format='json')
+        self.assertEqual(response.status_code, 201)
+        return str(response.data['id'])
+
+    def feed(self, **params):
+        response = self.client.get('/api/user/feed', dict(params, limit=params.get('limit', 20)))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def like(self, promo_id, users=1):
+        for i in range(users):
+            user = User.objects.create(name='Fan', surname='Test', email=f'fan{promo_id}{i}@example.com')
+            self.assertEqual(auth_client(user).post(f'/api/user/promo/{promo_id}/like').status_code, 200)
+        fold()
+
+    def ids(self, body):
+        return [item['promo_id'] for item in body['data']]
+
+    def test_popular_follows_likes_overall_and_per_category(self):
+        food = self.create(target={'categories': ['Food']})
+        travel = self.create(target={'categories': ['travel']})
+        plain = self.create()
+        self.like(travel, 2)
+        self.like(food, 1)
+
+        self.assertEqual(self.ids(self.feed(sort='popular')), [travel, food, plain])
+        self.assertEqual(self.ids(self.feed(sort='popular', category='food')), [food])
+
+        self.like(plain, 3)
+        self.assertEqual(self.ids(self.feed(sort='popular')), [plain, travel, food])
+
+        response = self.company_client.patch(f'/api/business/promo/{plain}', {'target': {'categories': ['food']}},
+                                             format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(self.feed(sort='popular', category='food')), [plain, food])
+        self.assertEqual(self.ids(self.feed(sort='popular', category='travel')), [travel])
+
+    def test_popular_cursor_pages(self):
+        promos = [self.create() for _ in range(5)]
+        for count, promo_id in enumerate(promos):
+            self.like(promo_id, count % 3)
+        seen, cursor = [], ''
+        while cursor is not None:
+            body = self.feed(sort='popular', cursor=cursor, limit=2)
+            seen += self.ids(body)
+            cursor = body['next_cursor']
+        self.assertEqual(sorted(seen), sorted(promos))
+        self.assertEqual(seen, self.ids(self.feed(sort='popular')))
+
+    def test_new_and_ending_soon(self):
+        older = self.create(active_from='2025-01-01', active_until='2031-01-01')
+        newer = self.create(active_from='2025-06-01', active_until='2030-01-01')
+        ended = self.create(active_from='2020-01-01', active_until='2021-01-01')
+        self.assertEqual(self.ids(self.feed(sort='new')), [newer, older, ended])
+        self.assertEqual(self.ids(self.feed(sort='ending_soon')), [newer, older])
+
+    def test_unknown_sort_is_rejected(self):
+        self.assertEqual(self.client.get('/api/user/feed', {'sort': 'random'}).status_code, 400)
+
+    def test_popular_feed_query_count(self):
+        for _ in range(5):
+            self.create()
+        self.feed(sort='popular')
+        with self.assertNumQueries(PromoOutQueryCountTests.FEED_QUERIES):
+            self.client.get('/api/user/feed', {'sort': 'popular', 'limit': 5})
+
+
+class EligibleFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+        cls.ru = create_promo(cls.company, target={'country': 'ru'})
+        cls.us_adults = create_promo(cls.company, target={'country': 'US', 'age_from': 21})
+        cls.everyone = create_promo(cls.company)
+
+    def setUp(self):
+        cache.clear()
+        self.client = auth_client(self.user)
+
+    def eligible_ids(self):
+        response = self.client.get('/api/user/feed', {'eligible': 'true', 'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        return {item['promo_id'] for item in response.json()['data']}
+
+    def test_profile_changes_apply_to_the_same_token(self):
+        self.assertEqual(self.eligible_ids(), {str(self.ru.id_promo), str(self.everyone.id_promo)})
+        response = self.client.patch('/api/user/profile', {'other': {'age': 30, 'country': 'us'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.eligible_ids(), {str(self.us_adults.id_promo), str(self.everyone.id_promo)})
+
+    def test_token_carries_no_profile_claims(self):
+        token = EntityRefreshToken.for_user(self.user)
+        self.assertEqual((token['role'], token['name']), ('user', 'User'))
+        self.assertNotIn('country', token.payload)
+        self.assertNotIn('age', token.payload)
+
+
+def encoded_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+class CursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        # Two promos share every active_from date, so only the id tiebreaker orders them.
+        cls.promos = [create_promo(cls.company, description=f'Promo {i}',
+                                   active_from=datetime.date(2025, 1, 1 + i // 2)) for i in range(7)]
+
+    def setUp(self):
+        self.client = auth_client(self.company)
+
+    def company_ids(self, **params):
+        response = self.client.get('/api/business/promo', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['promo_id'] for item in response.json()], response.headers.get('X-Next-Cursor')
+
+    def test_cursor_pages_match_offset_pages(self):
+        expected = [str(promo.id_promo) for promo in
+                    sorted(self.promos, key=lambda promo: (promo.active_from, str(promo.id_promo)))]
+        by_offset = []
+        for offset in range(0, len(self.promos), 3):
+            by_offset += self.company_ids(limit=3, offset=offset)[0]
+        by_cursor, cursor = [], ''
+        while cursor is not None:
+            ids, cursor = self.company_ids(limit=3, cursor=cursor)
+            by_cursor += ids
+        self.assertEqual(by_cursor, by_offset)
+        self.assertEqual(by_cursor, expected)
+
+    def test_offset_pages_are_ordered(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.company_ids(limit=2, offset=2)
+
+    def test_malformed_cursor_is_rejected(self):
+        cursors = ('nope', encoded_cursor({'a': 1}), encoded_cursor([1, 2]), encoded_cursor(['2025-01-01']),
+                   encoded_cursor([None, None]), encoded_cursor([['2025-01-01'], 'x']),
+                   encoded_cursor(['not a date', str(self.promos[0].id_promo)]),
+                   encoded_cursor(['2025-01-01', 'not a uuid']))
+        for cursor in cursors:
+            response = self.client.get('/api/business/promo', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json()['message'], 'Invalid cursor.')
+        user_client = auth_client(self.user)
+        for cursor in (encoded_cursor([1, 2]), encoded_cursor(['2025-01-01T00:00:00+00:00', 'x'])):
+            self.assertEqual(user_client.get('/api/user/promo/history', {'cursor': cursor}).status_code, 400)
+
+    def test_limit_and_offset_are_validated(self):
+        for params in ({'limit': 0}, {'limit': -1}, {'limit': 'ten'}, {'offset': -5}, {'offset': 'x'}):
+            for mode in ({}, {'cursor': ''}):
+                response = self.client.get('/api/business/promo', dict(params, **mode))
+                if 'offset' in params and mode:
+                    self.assertEqual(response.status_code, 200)
+                    continue
+                self.assertEqual(response.status_code, 400, (params, mode))
+                self.assertIn(next(iter(params)), response.json()['message'])
+        self.assertEqual(auth_client(self.user).get('/api/user/promo/history', {'limit': 0}).status_code, 400)
+
+    @override_settings(MAX_PAGE_SIZE=5)
+    def test_limit_is_capped(self):
+        user_client = auth_client(self.user)
+        promo = self.promos[0]
+        urls = (('/api/business/promo', self.client), ('/api/user/feed', user_client),
+                ('/api/user/promo/history', user_client), (f'/api/user/promo/{promo.id_promo}/comments', user_client))
+        for url, client in urls:
+            for mode in ({}, {'cursor': ''}):
+                with self.subTest(url=url, **mode):
+                    self.assertEqual(client.get(url, dict(mode, limit=5)).status_code, 200)
+                    response = client.get(url, dict(mode, limit=6))
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json()['message'], "'limit' must be an integer from 1 to 5.")
+
+
+class SortedCursorTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        # Dates, scores and ranks repeat, so every ordering relies on its id tiebreaker somewhere.
+        cls.promos = [create_promo(cls.company, description=f'Pizza deal {i}' if i % 2 else f'Coffee {i}',
+                                   active_from=datetime.date(2025, 1, 1 + i % 3),
+                                   active_until=datetime.date(2030, 1, 1 + i % 2), like_count=i % 3)
+                      for i in range(8)]
+        sync_ranks(cls.promos, created=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user_client = auth_client(self.user)
+        self.company_client = auth_client(self.company)
+
+    def feed_pages(self, **params):
+        seen, cursor = [], ''
+        while cursor is not None:
+            response = self.user_client.get('/api/user/feed', dict(params, limit=3, cursor=cursor))
+            self.assertEqual(response.status_code, 200, response.content)
+            seen += [item['promo_id'] for item in response.json()['data']]
+            cursor = response.json()['next_cursor']
+        return seen
+
+    def company_pages(self, **params):
+        seen, cursor = [], ''
+        while cursor is not None:
+            response = self.company_client.get('/api/business/promo', dict(params, limit=3, cursor=cursor))
+            self.assertEqual(response.status_code, 200, response.content)
+            seen += [item['promo_id'] for item in response.json()]
+            cursor = response.headers.get('X-Next-Cursor')
+        return seen
+
+    def test_feed_cursor_pages_every_sort(self):
+        cases = [{}, {'sort': 'new'}, {'sort': 'ending_soon'}, {'sort': 'popular'}, {'q': 'pizza'},
+                 {'q': 'pizza', 'sort': 'popular'}]
+        for fast in (True, False):
+            for params in cases:
+                with self.subTest(fast=fast, **params), override_settings(API_FAST_SERIALIZATION=fast):
+                    expected = self.user_client.get('/api/user/feed', dict(params, limit=20)).json()['data']
+                    expected = [item['promo_id'] for item in expected]
+                    self.assertEqual(self.feed_pages(**params), expected)
+                    self.assertEqual(len(set(expected)), 4 if 'q' in params else 8)
+
+    def test_company_cursor_pages_every_sort(self):
+        for fast in (True, False):
+            for params in ({}, {'sort_by': 'active_from'}, {'sort_by': 'active_until'}, {'q': 'pizza'},
+                           {'q': 'pizza', 'sort_by': 'active_until'}):
+                with self.subTest(fast=fast, **params), override_settings(API_FAST_SERIALIZATION=fast):
+                    expected = [item['promo_id'] for item in
+                                self.company_client.get('/api/business/promo', dict(params, limit=20)).json()]
+                    self.assertEqual(self.company_pages(**params), expected)
+                    self.assertEqual(len(set(expected)), 4 if 'q' in params else 8)
+
+    def test_malformed_cursor_for_every_sort(self):
+        promo_id = str(self.promos[0].id_promo)
+        for params in ({'sort': 'popular'}, {'sort': 'new'}, {'sort': 'ending_soon'}, {'q': 'pizza'}):
+            for values in (['abc', promo_id], ['1', 'abc'], [1, promo_id]):
+                with self.subTest(values=values, **params):
+                    response = self.user_client.get('/api/user/feed', dict(params, cursor=encoded_cursor(values)))
+                    self.assertEqual(response.status_code, 400)
+        for params in ({'q': 'pizza'}, {'sort_by': 'active_until'}):
+            with self.subTest(**params):
+                response = self.company_client.get('/api/business/promo',
+                                                   dict(params, cursor=encoded_cursor(['abc', promo_id])))
+                self.assertEqual(response.status_code, 400)
+
+
+class PromoLikeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        cls.promo = create_promo(cls.company)
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+        self.url = f'/api/user/promo/{self.promo.id_promo}/like'
+
+    def like_count(self):
+        return with_counters(Promo.objects).values_list('like_total', flat=True).get(id_promo=self.promo.id_promo)
+
+    def test_like_and_unlike_are_idempotent(self):
+        self.assertEqual(self.client.post(self.url).json(), {"status": "success"})
+        self.assertEqual(self.client.post(self.url).json(), {"status": "ok"})
+        self.assertEqual(self.like_count(), 1)
+        self.assertTrue(PromoLike.objects.filter(user=self.user, promo=self.promo).exists())
+
+        self.assertEqual(self.client.delete(self.url).json(), {"status": "ok"})
+        self.assertEqual(self.client.delete(self.url).json(), {"status": "error"})
+        self.assertEqual(self.like_count(), 0)
+        self.assertFalse(PromoLike.objects.exists())
+
+    def test_likes_from_many_users_are_counted(self):
+        for i in range(3):
+            user = User.objects.create(name='Fan', surname='Test', email=f'fan{i}@example.com')
+            auth_client(user).post(self.url)
+        self.assertEqual(self.like_count(), 3)
+        self.client.post(self.url)
+        body = self.client.get(f'/api/user/promo/{self.promo.id_promo}').json()
+        self.assertEqual((body['like_count'], body['is_liked_by_user']), (4, True))
+
+    def test_unknown_promo(self):
+        url = '/api/user/promo/00000000-0000-0000-0000-000000000000/like'
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+
+class CommentCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        cls.promo = create_promo(cls.company, comment_count=4)
+        cls.other_promo = create_promo(cls.company)
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+        self.url = f'/api/user/promo/{self.promo.id_promo}/comments'
+
+    def comment_counts(self):
+        return dict(with_counters(Promo.objects).values_list('id_promo', 'comment_total'))
+
+    def test_create_and_delete_move_the_count(self):
+        ids = [self.client.post(self.url, {'text': f'Comment {i}'}, format='json').json()['id'] for i in range(3)]
+        self.assertEqual(self.comment_counts()[self.promo.id_promo], 7)
+        self.assertEqual(self.client.delete(f'{self.url}/{ids[0]}').status_code, 200)
+        self.assertEqual(self.comment_counts()[self.promo.id_promo], 6)
+        self.assertEqual(self.client.get(f'/api/user/promo/{self.promo.id_promo}').json()['comment_count'], 6)
+
+        fold()
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.comment_count, 6)
+
+    def test_rejected_delete_keeps_the_count(self):
+        comment_id = self.client.post(self.url, {'text': 'Comment'}, format='json').json()['id']
+        before = self.comment_counts()
+        for url in (f'{self.url}/00000000-0000-0000-0000-000000000000',
+                    f'/api/user/promo/{self.other_promo.id_promo}/comments/{comment_id}'):
+            self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.comment_counts(), before)
+        self.assertEqual(before[self.other_promo.id_promo], 0)
+        self.assertTrue(PromoComment.objects.filter(comment_id=comment_id).exists())
+
+    def test_invalid_comment_is_not_counted(self):
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, 400)
+        self.assertEqual(self.comment_counts()[self.promo.id_promo], 4)
+
+
+class CounterShardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.promo = create_promo(cls.company, like_count=5, comment_count=1)
+        sync_ranks([cls.promo], created=True)
+        cls.users = [User.objects.create(name='Fan', surname='Test', email=f'fan{i}@example.com') for i in range(20)]
+
+    def test_hot_promo_writes_spread_over_shards_and_read_through(self):
+        for user in self.users:
+            auth_client(user).post(f'/api/user/promo/{self.promo.id_promo}/like')
+        auth_client(self.users[0]).delete(f'/api/user/promo/{self.promo.id_promo}/like')
+        shards = PromoCounterShard.objects.filter(promo=self.promo)
+        self.assertGreater(shards.count(), 1)
+        self.assertLessEqual(shards.count(), settings.COUNTER_SHARDS)
+        self.promo.refresh_from_db()
+        self.assertEqual(self.promo.like_count, 5)
+
+        client = auth_client(self.users[1])
+        self.assertEqual(client.get(f'/api/user/promo/{self.promo.id_promo}').json()['like_count'], 24)
+        self.assertEqual(client.get('/api/user/feed').json()['data'][0]['like_count'], 24)
+        stats = auth_client(self.company).get(f'/api/business/promo/{self.promo.id_promo}/stat').json()
+        self.assertEqual((stats['like_count'], stats['daily'][0]['likes']), (24, 19))
+
+    def test_fold_moves_deltas_onto_the_promo(self):
+        for user in self.users[:3]:
+            auth_client(user).post(f'/api/user/promo/{self.promo.id_promo}/like')
+        auth_client(self.users[0]).post(f'/api/user/promo/{self.promo.id_promo}/comments', {'text': 'Hi'},
+                                        format='json')
+        shards = PromoCounterShard.objects.count()
+
+        self.assertEqual(fold(), shards)
+        self.assertFalse(PromoCounterShard.objects.exists())
+        self.promo.refresh_from_db()
+        self.assertEqual((self.promo.like_count, self.promo.comment_count), (8, 2))
+        daily = PromoDailyStat.objects.get(promo=self.promo)
+        self.assertEqual((daily.likes, daily.comments), (3, 1))
+        self.assertEqual(self.promo.ranks.get(category='').score, 8)
+        body = auth_client(self.users[0]).get(f'/api/user/promo/{self.promo.id_promo}').json()
+        self.assertEqual((body['like_count'], body['comment_count']), (8, 2))
+        self.assertEqual(fold(), 0)
+
+
+class PromoHistoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       other={'age': 20, 'country': 'ru'})
+        cls.promos = [create_promo(cls.company, description=f'Promo {i}') for i in range(5)]
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def test_activation_is_recorded_and_flagged(self):
+        promo = self.promos[0]
+        self.assertEqual(self.client.post(f'/api/user/promo/{promo.id_promo}/activate').status_code, 200)
+        self.assertTrue(self.client.get(f'/api/user/promo/{promo.id_promo}').json()['is_activated_by_user'])
+        flags = {item['promo_id']: item['is_activated_by_user']
+                 for item in self.client.get('/api/user/feed', {'limit': 10}).json()['data']}
+        self.assertEqual(flags, {str(p.id_promo): p == promo for p in self.promos})
+        body = self.client.get('/api/user/promo/history').json()
+        self.assertEqual([item['promo_id'] for item in body['data']], [str(promo.id_promo)])
+        self.assertEqual(body['data'][0]['company_name'], 'Company')
+
+    def test_history_pages_newest_first(self):
+        base = timezone.now()
+        PromoActivation.objects.bulk_create([
+            PromoActivation(user=self.user, promo=promo, activated_at=base - datetime.timedelta(minutes=i))
+            for i, promo in enumerate(self.promos)
+        ] + [PromoActivation(user=self.user, promo=self.promos[1], activated_at=base - datetime.timedelta(minutes=1))])
+        other = User.objects.create(name='Other', surname='Test', email='other@example.com')
+        PromoActivation.objects.create(user=other, promo=self.promos[0])
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2} if cursor is None else {'limit': 2, 'cursor': cursor}
+            with self.assertNumQueries(1):
+                body = self.client.get('/api/user/promo/history', params).json()
+            seen += [item['description'] for item in body['data']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['Promo 0', 'Promo 1', 'Promo 1', 'Promo 2', 'Promo 3', 'Promo 4'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/user/promo/history', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class PromoActivationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.users = [User.objects.create(name='User', surname='Test', email=f'user{i}@example.com',
+                                         other={'age': 20, 'country': 'ru'}) for i in range(3)]
+
+    def activate(self, user, promo):
+        return auth_client(user).post(f'/api/user/promo/{promo.id_promo}/activate')
+
+    def test_common_promo_runs_out(self):
+        promo = create_promo(self.company, max_count=2, promo_common='COMMON-CODE')
+        for user in self.users[:2]:
+            response = self.activate(user, promo)
+            self.assertEqual((response.status_code, response.json()), (200, {"code": "COMMON-CODE"}))
+        self.assertEqual(self.activate(self.users[2], promo).status_code, 400)
+        promo.refresh_from_db()
+        self.assertEqual(promo.max_count, 0)
+        self.assertEqual(PromoActivation.objects.filter(promo=promo).count(), 2)
+
+    def test_unique_codes_are_handed_out_once(self):
+        promo = create_promo(self.company, mode='UNIQUE', promo_common='')
+        generate_codes(promo, 2)
+        codes = [self.activate(user, promo) for user in self.users]
+        self.assertEqual([response.status_code for response in codes], [200, 200, 400])
+        handed_out = {response.json()['code'] for response in codes[:2]}
+        self.assertEqual(handed_out, set(promo.codes.values_list('code', flat=True)))
+        self.assertEqual(set(promo.codes.values_list('claimed_by_id', flat=True)),
+                         {self.users[0].id, self.users[1].id})
+        self.assertEqual(PromoActivation.objects.filter(promo=promo).count(), 2)
+
+    def test_rejected_activation_keeps_the_code(self):
+        inactive = create_promo(self.company, mode='UNIQUE', promo_common='', active=False)
+        foreign = create_promo(self.company, mode='UNIQUE', promo_common='', target={'country': 'us'})
+        too_old = create_promo(self.company, max_count=1, target={'age_until': 18})
+        for promo in (inactive, foreign):
+            generate_codes(promo, 1)
+
+        for promo in (inactive, foreign, too_old):
+            self.assertEqual(self.activate(self.users[0], promo).status_code, 403)
+        self.assertFalse(PromoCode.objects.filter(claimed_at__isnull=False).exists())
+        too_old.refresh_from_db()
+        self.assertEqual(too_old.max_count, 1)
+        self.assertFalse(PromoActivation.objects.exists())
+
+
+class PromoCodeImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.promo = create_promo(cls.company, mode='UNIQUE', promo_common='')
+
+    def setUp(self):
+        self.client = auth_client(self.company)
+        self.url = f'/api/business/promo/{self.promo.id_promo}/codes'
+
+    def upload(self, body, content_type):
+        return self.client.post(self.url, data=body, content_type=content_type)
+
+    def test_csv_and_ndjson_import(self):
+        response = self.upload(b'a\nb,ignored\n\n"c"\na\n', 'text/csv')
+        self.assertEqual(response.json(), {"status": "success", "added": 3})
+        response = self.upload(b'"c"\n{"code": "d"}\n\n" e "\n', 'application/x-ndjson')
+        self.assertEqual(response.json(), {"status": "success", "added": 2})
+        self.assertEqual(sorted(self.promo.codes.values_list('code', flat=True)), ['a', 'b', 'c', 'd', 'e'])
+
+    def test_ndjson_rejects_non_string_codes(self):
+        for line in (b'[1]', b'12345', b'{"code": 7}', b'null', b'{"code": ["x"]}'):
+            response = self.upload(b'"ok"\n' + line + b'\n', 'application/x-ndjson')
+            self.assertEqual(response.status_code, 400, line)
+            self.assertIn('Line 2', response.json()['message'])
+        response = self.upload(b'"ok"\n{oops\n', 'application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', response.json()['message'])
+        self.assertFalse(self.promo.codes.exists())
+
+    def test_generate(self):
+        response = self.client.post(f'{self.url}?generate=25')
+        self.assertEqual(response.json(), {"status": "success", "added": 25})
+        codes = list(self.promo.codes.values_list('code', flat=True))
+        self.assertEqual(len(set(codes)), 25)
+        for generate in ('0', '-1', 'many'):
+            self.assertEqual(self.client.post(f'{self.url}?generate={generate}').status_code, 400)
+        self.assertEqual(self.promo.codes.count(), 25)
+
+    @override_settings(CODE_GENERATE_MAX=50)
+    def test_generate_is_capped(self):
+        self.assertEqual(self.client.post(f'{self.url}?generate=50').json()['added'], 50)
+        response = self.client.post(f'{self.url}?generate=51')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], "'generate' must be an integer from 1 to 50.")
+        self.assertEqual(self.promo.codes.count(), 50)
+
+    def test_non_utf8_upload_is_rejected(self):
+        for content_type in ('text/csv', 'application/x-ndjson'):
+            response = self.upload('"a"\n"b"\n'.encode() + '"ü"\n'.encode('latin-1'), content_type)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['message'], 'Line 3 is not valid UTF-8.')
+        self.assertFalse(self.promo.codes.exists())
+
+    def test_include_codes_lists_free_codes(self):
+        self.upload(b'a\nb\nc\n', 'text/csv')
+        user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        self.assertEqual(auth_client(user).post(f'/api/user/promo/{self.promo.id_promo}/activate').json(),
+                         {"code": "a"})
+
+        url = f'/api/business/promo/{self.promo.id_promo}'
+        body = self.client.get(url, {'include_codes': 'true'}).json()
+        self.assertEqual(body['promo_unique'], ['b', 'c'])
+        self.assertEqual((body['promo_unique_total'], body['promo_unique_available']), (3, 2))
+        self.assertNotIn('promo_unique', self.client.get(url).json())
+
+
+class PromoSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com')
+        cls.other_company = Company.objects.create(name='Other', email='other@example.com')
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com')
+        cls.pizza = create_promo(cls.company, description='Pizza pizza pizza for the whole family')
+        cls.combo = create_promo(cls.company, description='Burger and pizza combo')
+        cls.coffee = create_promo(cls.company, description='Кофе с собой бесплатно')
+        cls.foreign = create_promo(cls.other_company, description='Pizza night',
+                                   active_from=datetime.date(2025, 6, 1))
+
+    def setUp(self):
+        self.client = auth_client(self.user)
+
+    def feed_ids(self, **params):
+        response = self.client.get('/api/user/feed', dict(params, limit=params.get('limit', 20)))
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['promo_id'] for item in response.json()['data']]
+
+    def test_feed_search_is_ranked(self):
+        self.assertEqual(self.feed_ids(q='pizza')[0], str(self.pizza.id_promo))
+        self.assertEqual(set(self.feed_ids(q='pizza')),
+                         {str(promo.id_promo) for promo in (self.pizza, self.combo, self.foreign)})
+        self.assertEqual(self.feed_ids(q='burger pizza'), [str(self.combo.id_promo)])
+        self.assertEqual(self.feed_ids(q='кофе'), [str(self.coffee.id_promo)])
+        self.assertEqual(self.feed_ids(q='sushi'), [])
+        self.assertEqual(self.feed_ids(q='pizza', sort='new')[0], str(self.foreign.id_promo))
+
+    def test_feed_search_cursor_pages(self):
+        seen, cursor = [], ''
+        while cursor is not None:
+            response = self.client.get('/api/user/feed', {'q': 'pizza', 'limit': 1, 'cursor': cursor}).json()
+            seen += [item['promo_id'] for item in response['data']]
+            cursor = response['next_cursor']
+        self.assertEqual(seen, self.feed_ids(q='pizza'))
+
+    def test_feed_search_query_count(self):
+        self.feed_ids(q='pizza')
+        with self.assertNumQueries(PromoOutQueryCountTests.FEED_QUERIES):
+            self.client.get('/api/user/feed', {'q': 'pizza', 'limit': 5})
+
+    def test_search_tracks_description_changes(self):
+        client = auth_client(self.company)
+        response = client.patch(f'/api/business/promo/{self.coffee.id_promo}', {'description': 'Pizza coffee'},
+                                format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(str(self.coffee.id_promo), self.feed_ids(q='pizza'))
+        self.assertEqual(self.feed_ids(q='кофе'), [])
+
+    def test_company_list_search(self):
+        response = auth_client(self.company).get('/api/business/promo', {'q': 'pizza', 'cursor': ''})
+        self.assertEqual([item['promo_id'] for item in response.json()],
+                         [str(self.pizza.id_promo), str(self.combo.id_promo)])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for q in ('pizza"', 'AND OR NOT', '(pizza', '*', 'pizza -burger'):
+            self.assertEqual(self.client.get('/api/user/feed', {'q': q}).status_code, 200, q)
+
+    def test_relevance_needs_a_query(self):
+        self.assertEqual(self.client.get('/api/user/feed', {'sort': 'relevance'}).status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', 'stemming comes from the Postgres text search config')
+    def test_search_matches_word_forms(self):
+        self.assertEqual(self.feed_ids(q='бесплатная'), [str(self.coffee.id_promo)])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class StatelessApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = Company.objects.create(name='Company', email='company@example.com',
+                                             password=make_password(PASSWORD))
+        cls.user = User.objects.create(name='User', surname='Test', email='user@example.com',
+                                       password=make_password(PASSWORD))
+
+    def test_sign_in_writes_no_session(self):
+        client = APIClient()
+        for path, email in (('/api/business/auth/sign-in', self.company.email),
+                            ('/api/user/auth/sign-in', self.user.email)):
+            response = client.post(path, {'email': email, 'password': PASSWORD}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertFalse(Session.objects.exists())
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['token']}")
+        self.assertEqual(client.get('/api/user/profile').status_code, 200)
+
+    def test_api_skips_browser_middleware_but_admin_keeps_it(self):
+        response = APIClient().get('/api/ping')
+        self.assertNotIn('X-Frame-Options', response.headers)
+        self.assertFalse(hasattr(response.wsgi_request, 'session'))
+
+        response = self.client.get('/admin/login/')
+        self.assertEqual(response.headers['X-Frame-Options'], 'DENY')
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertTrue(hasattr(response.wsgi_request, 'session'))
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Company, User
+
+ROLE_COMPANY = 'company'
+ROLE_USER = 'user'
+
+
+def _status_key(jti):
+    return f'token:revoked:{jti}'
+
+
+def _status_timeout():
+    return getattr(settings, 'TOKEN_STATUS_CACHE_TIMEOUT', 60)
+
+
+def entity_role(entity):
+    if isinstance(entity, Company):
+        return ROLE_COMPANY
+    if isinstance(entity, User):
+        return ROLE_USER
+    if Company.objects.filter(id=entity.id).exists():
+        return ROLE_COMPANY
+    return ROLE_USER
+
+
+def entity_claims(entity):
+    # Only claims that never change: the profile is edited after the token is issued.
+    return {'role': entity_role(entity), 'name': entity.name}
+
+
+def mark_revoked(jtis):
+    timeout = api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()
+    cache.set_many({_status_key(jti): True for jti in jtis}, timeout)
+
+
+def revoke_user_tokens(user):
+    tokens = list(OutstandingToken.objects
+                  .filter(user=user, expires_at__gt=timezone.now(), blacklistedtoken__isnull=True)
+                  .values_list('id', 'jti'))
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id=token_id) for token_id, _ in tokens],
+                                         ignore_conflicts=True)
+    mark_revoked([jti for _, jti in tokens])
+    return len(tokens)
+
+
+class EntityRefreshToken(RefreshToken):
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim, value in entity_claims(user).items():
+            token[claim] = value
+        cache.set(_status_key(token[api_settings.JTI_CLAIM]), False, _status_timeout())
+        return token
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        key = _status_key(jti)
+        revoked = cache.get(key)
+        if revoked is None:
+            revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+            cache.set(key, revoked, _status_timeout())
+        if revoked:
+            raise TokenError(_("Token is blacklisted"))
+
+
+class EntityTokenUser(TokenUser):
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def name(self):
+        return self.token.get('name', '')
@@ -1,16 +1,33 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.contrib.auth import authenticate, login
-from django.http import JsonResponse
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.contrib.auth import authenticate
+from django.http import HttpResponse, JsonResponse
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import User, Promo, PromoComment
+from .models import User, Promo, PromoActivation, PromoComment, PromoLike
 from .serializers import *
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
-from django.core.paginator import Paginator, EmptyPage
-from .permissions import IsCompany, IsUser
+from django.core.paginator import EmptyPage
+from .pagination import paginate, InvalidCursor
+from .permissions import IsCompany, IsMetricsScraper, IsUser
+from .stats import promo_stats, record_like, record_comment
+from .ranking import OVERALL
+from .tokens import EntityRefreshToken, revoke_user_tokens
+from .activation import activate_promo, ActivationError
+from .batch import create_promos, update_promos, set_active
+from .cache import cached_promo, cached_profile, invalidate_promo, invalidate_profile
+from .conditional import conditional, bump_user, bump_versions, FEED_SCOPE
+from .metrics import metrics, render_prometheus, PROMETHEUS_CONTENT_TYPE
+from .fastpath import (json_response, promo_out_rows, promo_for_company_out_rows, values_for, PROMO_OUT_VALUES,
+                       PROMO_FOR_COMPANY_OUT_VALUES)
+from .counters import with_counters
+from .search import search_promos
+from .codes import with_pool_counts, parse_stream, add_codes, generate_codes, CodeImportError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
 from django.db.utils import IntegrityError
 
 
@@ -21,6 +38,14 @@ class PingView(APIView):
         return Response({"status": "PROOOOOOOOOOOOOOOOOOOOD"}, status=status.HTTP_200_OK)
 
 
+class MetricsView(APIView):
+    permission_classes = (IsMetricsScraper,)
+    authentication_classes = ()
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(metrics.collect()), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 class RegisterCompanyView(APIView):
     permission_classes = (AllowAny,)
 
@@ -29,7 +54,7 @@ class RegisterCompanyView(APIView):
             serializer = CompanySerializer(data=request.data)
             if serializer.is_valid():
                 new_user = serializer.save()
-                refresh = RefreshToken.for_user(new_user)
+                refresh = EntityRefreshToken.for_user(new_user)
                 return Response({"company_id": new_user.id, 'token': str(refresh)}, status=status.HTTP_200_OK)
         except IntegrityError:
             return Response({"status": "error", "message": "Такой email уже зарегистрирован."},
@@ -51,73 +76,128 @@ class CompanySinginView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
         user = authenticate(request, email=email, password=password)
         if user:
-            self.invalidate_old_tokens(user=user)
-            login(request, user)
-            refresh = RefreshToken.for_user(user)
+            revoke_user_tokens(user)
+            refresh = EntityRefreshToken.for_user(user)
             return JsonResponse({'token': str(refresh)},
                                 status=status.HTTP_200_OK)
         return Response({"status": "error", "message": "Неверный email или пароль."},
                         status=status.HTTP_401_UNAUTHORIZED)
 
-    def invalidate_old_tokens(self, user):
-        tokens = OutstandingToken.objects.filter(user=user)
-        for token in tokens:
-            if not BlacklistedToken.objects.filter(token=token).exists():
-                BlacklistedToken.objects.create(token=token)
-
 
 class PromoListView(APIView):
     permission_classes = (IsAuthenticated, IsCompany,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
 
     def post(self, request):
         serializer = PromoSerializer(data=self.request.data)
         if serializer.is_valid():
-            new_promo = serializer.save(company=self.request.user)
+            new_promo = serializer.save(company_id=self.request.user.id)
             return Response({'id': new_promo.id_promo}, status=status.HTTP_201_CREATED)
         return Response({"status": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request):
-        queryset = Promo.objects.filter(company_id=self.request.user.id)
+        queryset = with_counters(with_pool_counts(
+            Promo.objects.select_related('company').filter(company_id=self.request.user.id)))
         countries = request.query_params.getlist('country', [])
         if countries:
-            queryset = queryset.filter(target__country__in=[country.lower() for country in countries])
+            queryset = queryset.filter(target_country__in=[country.lower() for country in countries])
+
+        q = request.query_params.get('q', '').strip()
+        if q:
+            queryset = search_promos(queryset, q)
 
         sort_by = request.query_params.get('sort_by')
+        ordering = ('active_from', 'id_promo')
         if sort_by in ['active_from', 'active_until']:
             queryset = queryset.order_by(sort_by)
-
-        limit = int(request.query_params.get('limit', 10))
-        offset = int(request.query_params.get('offset', 0))
-        paginator = Paginator(queryset, limit)
-        total_count = paginator.count
+            ordering = (sort_by, 'id_promo')
+        elif q:
+            queryset = queryset.order_by('-search_rank', '-id_promo')
+            ordering = ('-search_rank', '-id_promo')
+
+        fast = getattr(settings, 'API_FAST_SERIALIZATION', False)
+        if fast:
+            queryset = queryset.values(*values_for(PROMO_FOR_COMPANY_OUT_VALUES, ordering))
         try:
-            promos = paginator.page((offset // limit) + 1)
+            page = paginate(request, queryset, ordering)
         except EmptyPage:
             return Response({
                 "status": "error",
                 "message": "No data available for the requested page."
             }, status=status.HTTP_400_BAD_REQUEST)
-        serializer = PromoForCompanyOutSerializer(promos, many=True)
-        response = Response(serializer.data, status=status.HTTP_200_OK)
-        response['X-Total-Count'] = total_count
+        except InvalidCursor as e:
+            return Response({"status": "error", "message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+        if fast:
+            data, has_float = promo_for_company_out_rows(page.items)
+            response = json_response(data, exact_floats=has_float)
+        else:
+            serializer = PromoForCompanyOutSerializer(page.items, many=True)
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+
+        return page.apply_headers(response)
 
-        return response
+
+class PromoBatchView(APIView):
+    permission_classes = (IsAuthenticated, IsCompany,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
+    max_items = 5000
+
+    def post(self, request):
+        data = request.data
+        create = data.get('create', []) if isinstance(data, dict) else None
+        update = data.get('update', []) if isinstance(data, dict) else None
+        deactivate = data.get('deactivate', []) if isinstance(data, dict) else None
+        reactivate = data.get('reactivate', []) if isinstance(data, dict) else None
+        if not all(isinstance(part, list) for part in (create, update, deactivate, reactivate)):
+            return Response({"status": "error", "message": "Ошибка в данных запроса."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(create) + len(update) + len(deactivate) + len(reactivate) > self.max_items:
+            return Response({"status": "error", "message": f"At most {self.max_items} items per batch."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        company_id = request.user.id
+        with transaction.atomic():
+            result = {
+                "created": create_promos(company_id, create),
+                "updated": update_promos(company_id, update),
+                "deactivated": set_active(company_id, deactivate, False),
+                "reactivated": set_active(company_id, reactivate, True),
+            }
+        return Response(result, status=status.HTTP_200_OK)
 
 
 class PromoByIdView(APIView):
     permission_classes = (IsAuthenticated, IsCompany)
+    authentication_classes = (JWTStatelessUserAuthentication,)
 
+    @conditional(lambda request, id_promo: (('promo', id_promo),))
     def get(self, request, id_promo):
-        try:
-            promo = Promo.objects.get(id_promo=id_promo, company_id=request.user.id)
-        except Promo.DoesNotExist:
+        if request.query_params.get('include_codes', '').lower() in ('1', 'true'):
+            try:
+                promo = with_counters(with_pool_counts(Promo.objects.select_related('company'))).get(
+                    id_promo=id_promo, company_id=request.user.id)
+            except Promo.DoesNotExist:
+                return Response({"status": "error", "message": "Promo does not exist."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            serializer = PromoForCompanyOutSerializer(promo, context={"include_codes": True})
+            return Response(serializer.data, status=status.HTTP_200_OK)
+
+        def build():
+            promo = with_counters(with_pool_counts(Promo.objects.select_related('company'))).filter(
+                id_promo=id_promo).first()
+            if promo is None:
+                return None
+            return dict(PromoForCompanyOutSerializer(promo).data)
+
+        data, hit = cached_promo('company', id_promo, build)
+        if data is None or data['company_id'] != str(request.user.id):
             return Response({"status": "error", "message": "Promo does not exist."}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = PromoForCompanyOutSerializer(promo)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(data, status=status.HTTP_200_OK)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
 
     def patch(self, request, id_promo):
         try:
-            promo = Promo.objects.get(id_promo=id_promo, company_id=request.user.id)
+            promo = with_counters(Promo.objects).get(id_promo=id_promo, company_id=request.user.id)
         except Promo.DoesNotExist:
             return Response({"error": "Promo not found."}, status=status.HTTP_404_NOT_FOUND)
         serializer = PromoSerializer(promo, data=request.data, partial=True)
@@ -127,16 +207,57 @@ class PromoByIdView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PromoStatView(APIView):
+class PromoCodesView(APIView):
     permission_classes = (IsAuthenticated, IsCompany,)
 
-    def get(self, request, id_promo):
+    def post(self, request, id_promo):
         try:
-            promo = Promo.objects.get(id_promo=id_promo)
-            serializer = PromoSerializer(promo)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            promo = Promo.objects.get(id_promo=id_promo, company_id=request.user.id)
         except Promo.DoesNotExist:
             return Response({"error": "Promo not found."}, status=status.HTTP_404_NOT_FOUND)
+        if promo.mode.upper() != "UNIQUE":
+            return Response({"status": "error", "message": "Promo is not in UNIQUE mode."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        generate = request.query_params.get('generate')
+        if generate is not None:
+            limit = getattr(settings, 'CODE_GENERATE_MAX', 100_000)
+            try:
+                count = int(generate)
+            except ValueError:
+                count = 0
+            if not 0 < count <= limit:
+                return Response({"status": "error", "message": f"'generate' must be an integer from 1 to {limit}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            if generate is not None:
+                added = generate_codes(promo, count)
+            elif request.stream is not None:
+                added = add_codes(promo, parse_stream(request.stream, request.content_type))
+            else:
+                added = 0
+        except CodeImportError as e:
+            return Response({"status": "error", "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        invalidate_promo(promo.id_promo, feed=False)
+        return Response({"status": "success", "added": added}, status=status.HTTP_200_OK)
+
+
+class PromoStatView(APIView):
+    permission_classes = (IsAuthenticated, IsCompany,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
+
+    def get(self, request, id_promo):
+        def build():
+            promo = Promo.objects.filter(id_promo=id_promo).first()
+            if promo is None:
+                return None
+            return promo_stats(promo)
+
+        data, hit = cached_promo('stat', id_promo, build)
+        if data is None or data['company_id'] != str(request.user.id):
+            return Response({"error": "Promo not found."}, status=status.HTTP_404_NOT_FOUND)
+        response = Response(data, status=status.HTTP_200_OK)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
 
 
 class UserRegistrationView(APIView):
@@ -147,7 +268,7 @@ class UserRegistrationView(APIView):
 
         if new_user.is_valid():
             saved_user = new_user.save()
-            refresh = RefreshToken.for_user(saved_user)
+            refresh = EntityRefreshToken.for_user(saved_user)
             return Response({"token": str(refresh)}, status=status.HTTP_201_CREATED)
         return Response({"status": "bad"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -160,23 +281,18 @@ class UserLoginView(APIView):
         password = request.data.get('password')
         user = authenticate(request, email=email, password=password)
         if user:
-            self.invalidate_old_tokens(user)
-            login(request, user)
-            refresh = RefreshToken.for_user(user)
+            revoke_user_tokens(user)
+            refresh = EntityRefreshToken.for_user(user)
             return JsonResponse({'token': str(refresh)},
                                 status=status.HTTP_200_OK)
         return Response({"status": "bad"}, status=status.HTTP_400_BAD_REQUEST)
 
-    def invalidate_old_tokens(self, user):
-        tokens = OutstandingToken.objects.filter(user=user)
-        for token in tokens:
-            if not BlacklistedToken.objects.filter(token=token).exists():
-                BlacklistedToken.objects.create(token=token)
-
 
 class UserProfileView(APIView):
     permission_classes = (IsAuthenticated, IsUser,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
 
+    @conditional(lambda request: (('profile', request.user.id),))
     def get(self, request):
         UserProfile = User.objects.filter(id=request.user.id)
         if UserProfile.exists():
@@ -188,83 +304,149 @@ class UserProfileView(APIView):
         serializer = UserSerializer(instance=UserProfile, data=request.data, partial=True)
         if serializer.is_valid():
             updated_user = serializer.save()
+            invalidate_profile(updated_user.id)
+            bump_versions(('profile', updated_user.id))
             return Response(UserOutSerializer(updated_user).data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+FEED_ORDERINGS = {
+    None: ('active_from', 'id_promo'),
+    'new': ('-active_from', '-id_promo'),
+    'ending_soon': ('active_until', 'id_promo'),
+    'popular': ('-popularity', '-id_promo'),
+    'relevance': ('-search_rank', '-id_promo'),
+}
+
+
 class UserFeedView(APIView):
     permission_classes = (IsAuthenticated, IsUser,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
 
+    @conditional(lambda request: (FEED_SCOPE, ('user', request.user.id), ('profile', request.user.id)),
+                 max_age=lambda: getattr(settings, 'FEED_MAX_AGE', 60))
     def get(self, request):
-        queryset = Promo.objects.all()
-        category = request.query_params.get('category', "")
-        limit = int(request.query_params.get('limit', 10))
-        offset = int(request.query_params.get('offset', 0))
+        queryset = with_counters(Promo.objects.select_related('company'))
+        category = request.query_params.get('category', "").strip().lower()
         active = request.query_params.getlist('active', True)
+        q = request.query_params.get('q', '').strip()
+        sort = request.query_params.get('sort') or ('relevance' if q else None)
+        if sort not in FEED_ORDERINGS or (sort == 'relevance' and not q):
+            return Response({"status": "error", "message": "Invalid sort."}, status=status.HTTP_400_BAD_REQUEST)
+        ordering = FEED_ORDERINGS[sort]
+
+        if q:
+            queryset = search_promos(queryset, q)
 
-        if category:
-            queryset = queryset.filter(target__categories__contains=[category.strip().lower()])
+        if sort == 'popular':
+            queryset = queryset.filter(ranks__category=category or OVERALL).annotate(popularity=F('ranks__score'))
+        elif category:
+            queryset = queryset.filter(target_categories__contains=[category])
+
+        if sort == 'ending_soon':
+            queryset = queryset.filter(active_until__gte=timezone.localdate())
 
         if active:
             queryset = queryset.filter(active=True)
 
-        paginator = Paginator(queryset, limit)
-        total_count = paginator.count
+        if request.query_params.get('eligible', '').lower() in ('1', 'true'):
+            queryset = queryset.eligible_for(cached_profile(request.user.id))
+
+        queryset = queryset.order_by(*ordering)
+        fast = getattr(settings, 'API_FAST_SERIALIZATION', False)
+        if fast:
+            queryset = queryset.values(*values_for(PROMO_OUT_VALUES, ordering))
         try:
-            promos = paginator.page((offset // limit) + 1)
+            page = paginate(request, queryset, ordering)
         except EmptyPage:
             return Response({
                 "status": "error",
                 "message": "No data available for the requested page."
             }, status=status.HTTP_400_BAD_REQUEST)
-        serializer = PromoOutSerializer(promos, many=True, context={"request": request})
-        response = Response({
-            "status": "success",
-            "count": paginator.count,
-            "data": serializer.data
-        }, status=status.HTTP_200_OK)
-        response['X-Total-Count'] = total_count
+        except InvalidCursor as e:
+            return Response({"status": "error", "message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+        data = {"status": "success"}
+        if page.total_count is not None:
+            data["count"] = page.total_count
+        flags = user_promo_flags(request.user, [item['id_promo'] if fast else item.id_promo for item in page.items])
+        if fast:
+            data["data"] = promo_out_rows(page.items, flags)
+        else:
+            data["data"] = PromoOutSerializer(page.items, many=True, context={"user_flags": flags}).data
+        if page.is_cursor:
+            data["next_cursor"] = page.next_cursor
+        response = json_response(data) if fast else Response(data, status=status.HTTP_200_OK)
 
-        return response
+        return page.apply_headers(response)
 
 
 class UserFeedViewById(APIView):
     permission_classes = (IsAuthenticated, IsUser,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
 
+    @conditional(lambda request, id_promo: (('promo', id_promo), ('user', request.user.id)))
     def get(self, request, id_promo):
-        try:
-            promo = Promo.objects.get(id_promo=id_promo)
-        except Promo.DoesNotExist:
+        def build():
+            promo = with_counters(Promo.objects.select_related('company')).filter(id_promo=id_promo).first()
+            if promo is None:
+                return None
+            return dict(PromoOutSerializer(promo, context={"user_flags": NO_USER_FLAGS}).data)
+
+        data, hit = cached_promo('user', id_promo, build)
+        if data is None:
             return Response({"status": "error", "message": "Promo does not exist."}, status=status.HTTP_400_BAD_REQUEST)
-        serializer = PromoOutSerializer(promo, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        flags = user_promo_flags(request.user, [id_promo])
+        response = Response(with_user_flags(data, flags), status=status.HTTP_200_OK)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+
+class UserPromoHistoryView(APIView):
+    permission_classes = (IsAuthenticated, IsUser,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
+
+    def get(self, request):
+        ordering = ('-activated_at', '-id')
+        queryset = PromoActivation.objects.select_related('promo__company').filter(user_id=request.user.id)
+        try:
+            page = paginate(request, queryset, ordering, keyset_only=True)
+        except InvalidCursor as e:
+            return Response({"status": "error", "message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+        data = {"status": "success", "data": PromoActivationOutSerializer(page.items, many=True).data}
+        if page.total_count is not None:
+            data["count"] = page.total_count
+        data["next_cursor"] = page.next_cursor
+        return page.apply_headers(Response(data, status=status.HTTP_200_OK))
 
 
 class UserPromoLikeView(APIView):
     permission_classes = (IsAuthenticated, IsUser,)
+    authentication_classes = (JWTStatelessUserAuthentication,)
 
     def post(self, request, id_promo):
-        promo = get_object_or_404(Promo, id_promo=id_promo)
-        user = request.user.user
-        if str(id_promo) in user.liked_promos:
+        promo = get_object_or_404(Promo.objects.only('id_promo'), id_promo=id_promo)
+        try:
+            with transaction.atomic():
+                PromoLike.objects.create(user_id=request.user.id, promo_id=promo.id_promo)
+                record_like(promo.id_promo, 1)
+        except IntegrityError:
+            # Already liked: the unique (user, promo) row is the source of truth.
             return Response(status=status.HTTP_200_OK, data={"status": "ok"})
-        user.liked_promos.append(id_promo)
-        user.save()
-        promo.like_count += 1
-        promo.save()
+        invalidate_promo(promo.id_promo, feed=False)
+        bump_user(request.user.id)
         return Response({"status": "success"}, status=status.HTTP_200_OK)
 
     def delete(self, request, id_promo):
-        promo = get_object_or_404(Promo, id_promo=id_promo)
-        user = request.user.user
-        if str(id_promo) in user.liked_promos:
-            user.liked_promos.remove(str(id_promo))
-            user.save()
-            promo.like_count -= 1
-            promo.save()
-            return Response(status=status.HTTP_200_OK, data={"status": "ok"})
-        else:
+        promo = get_object_or_404(Promo.objects.only('id_promo'), id_promo=id_promo)
+        with transaction.atomic():
+            deleted, _ = PromoLike.objects.filter(user_id=request.user.id, promo_id=promo.id_promo).delete()
+            if deleted:
+                record_like(promo.id_promo, -1)
+        if not deleted:
             return Response(status=status.HTTP_200_OK, data={"status": "error"})
+        invalidate_promo(promo.id_promo, feed=False)
+        bump_user(request.user.id)
+        return Response(status=status.HTTP_200_OK, data={"status": "ok"})
 
 
 class PromoCommentView(APIView):
@@ -275,37 +457,38 @@ class PromoCommentView(APIView):
         author = request.user.user
         serializer = PromoCommentSerializer(data=request.data, context={"author": author, "promo": promo})
         if serializer.is_valid():
-            new_comment = serializer.save()
+            with transaction.atomic():
+                new_comment = serializer.save()
+                record_comment(promo.id_promo, 1)
+            invalidate_promo(promo.id_promo, feed=False)
             return Response(PromoCommentOutSerializer(new_comment).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, id_promo):
-        queryset = PromoComment.objects.filter(promo__id_promo=id_promo)
-        queryset = queryset.order_by('-date')
-        limit = int(request.query_params.get('limit', 10))
-        offset = int(request.query_params.get('offset', 0))
+        queryset = PromoComment.objects.select_related('author').filter(promo_id=id_promo)
+        queryset = queryset.order_by('-date', '-comment_id')
 
-        paginator = Paginator(queryset, limit)
-        total_count = paginator.count
         try:
-            promos = paginator.page((offset // limit) + 1)
+            page = paginate(request, queryset, ('-date', '-comment_id'))
         except EmptyPage:
             return Response({
                 "status": "error",
                 "message": "No data available for the requested page."
             }, status=status.HTTP_400_BAD_REQUEST)
-        serializer = PromoCommentOutSerializer(promos, many=True)
+        except InvalidCursor as e:
+            return Response({"status": "error", "message": e.message}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = PromoCommentOutSerializer(page.items, many=True)
         response = Response(serializer.data, status=status.HTTP_200_OK)
-        response['X-Total-Count'] = total_count
 
-        return response
+        return page.apply_headers(response)
 
 
 class PromoCommentViewById(APIView):
     permission_classes = (IsAuthenticated, IsUser,)
 
     def get(self, request, id_promo, comment_id):
-        current_promo_comment = PromoComment.objects.get(promo__id_promo=id_promo, comment_id=comment_id)
+        current_promo_comment = get_object_or_404(PromoComment.objects.select_related('author'),
+                                                  promo_id=id_promo, comment_id=comment_id)
         serializer = PromoCommentOutSerializer(current_promo_comment)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -319,8 +502,12 @@ class PromoCommentViewById(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, id_promo, comment_id):
-        current_promo_comment = PromoComment.objects.get(promo__id_promo=id_promo, comment_id=comment_id)
-        current_promo_comment.delete()
+        with transaction.atomic():
+            deleted, _ = PromoComment.objects.filter(promo_id=id_promo, comment_id=comment_id).delete()
+            if not deleted:
+                return Response({"error": "Comment not found."}, status=status.HTTP_404_NOT_FOUND)
+            record_comment(id_promo, -1)
+        invalidate_promo(id_promo, feed=False)
         return Response(data={"status": "ok"}, status=status.HTTP_200_OK)
 
 
@@ -328,29 +515,18 @@ class PromoActivateView(APIView):
     permission_classes = (IsAuthenticated, IsUser,)
 
     def post(self, request, id_promo):
+        user = get_object_or_404(User, id=request.user.id)
         try:
-            promo = get_object_or_404(Promo, id_promo=id_promo)
+            promo = get_object_or_404(Promo.objects.with_eligibility(user.other), id_promo=id_promo)
         except Exception as e:
             return Response({"status": "error", "message": str(e)}, status=status.HTTP_404_NOT_FOUND)
         if not promo.active:
             return Response(status=status.HTTP_403_FORBIDDEN)
-        user = get_object_or_404(User, id=request.user.id)
-        if not (promo.target.get('age_from') <= user.other.get('age') <= promo.target.get('age_until')):
-            return Response(status=status.HTTP_403_FORBIDDEN)
-        if user.other.get('country') != promo.target.get('country'):
+        if not promo.is_eligible:
             return Response(status=status.HTTP_403_FORBIDDEN)
         # todo antifraud
-        if promo.mode.upper() == "COMMON" and promo.max_count <= 0:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        if promo.mode.upper() == "UNIQUE" and len(promo.promo_unique) == 0:
+        try:
+            code = activate_promo(promo, user.id, (user.other or {}).get('country'))
+        except ActivationError:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        if promo.mode.upper() == "UNIQUE":
-            code = promo.promo_unique.pop(0)
-            promo.save()
-            return Response(data={"code": code}, status=status.HTTP_200_OK)
-        if promo.mode.upper() == "COMMON":
-            code = promo.promo_common
-            promo.max_count -= 1
-            promo.save()
-            return Response(data={"code": code}, status=status.HTTP_200_OK)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+        return Response(data={"code": code}, status=status.HTTP_200_OK)
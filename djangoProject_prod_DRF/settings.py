@@ -58,7 +58,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'AUTH_HEADER_TYPES': ('Bearer',),
     'BLACKLIST_AFTER_ROTATION': True,
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.RefreshToken',),
+    'AUTH_TOKEN_CLASSES': ('api_app.tokens.EntityRefreshToken',),
+    'TOKEN_USER_CLASS': 'api_app.tokens.EntityTokenUser',
     'TOKEN_BLACKLIST_ENABLED': True,
     'ROTATE_REFRESH_TOKENS': True,
 }
@@ -71,15 +72,20 @@ SPECTACULAR_SETTINGS = {
 }
 
 MIDDLEWARE = [
+    'api_app.metrics.MetricsMiddleware',
+    'api_app.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'api_app.stateless.StatelessSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api_app.stateless.StatelessCsrfViewMiddleware',
+    'api_app.stateless.StatelessAuthenticationMiddleware',
+    'api_app.stateless.StatelessMessageMiddleware',
+    'api_app.stateless.StatelessXFrameOptionsMiddleware',
 ]
 
+# Requests under this prefix skip the session, CSRF, auth, messages and clickjacking middleware.
+STATELESS_API_PREFIX = '/api/'
+
 ROOT_URLCONF = 'djangoProject_prod_DRF.urls'
 
 TEMPLATES = [
@@ -111,10 +117,57 @@ DATABASES = {
         'USER': 'postgres',
         'PASSWORD': '',
         'HOST': 'localhost',
-        'sql_mode': 'traditional'
     }
 }
 
+DATABASE_ROUTERS = ['api_app.routers.PrimaryReplicaRouter']
+
+# Aliases in DATABASES that serve reads; a user who just wrote reads from the
+# primary for REPLICA_PIN_SECONDS.
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 5
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'promo-cache',
+        # Per process; settings_prod swaps in a shared Redis cache.
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+PROMO_CACHE_TIMEOUT = 300
+
+# Likes, comments and activations don't bump the feed's ETag; a revalidated feed may show
+# counters up to FEED_MAX_AGE seconds old.
+FEED_MAX_AGE = 60
+
+TOKEN_STATUS_CACHE_TIMEOUT = 60
+
+# Largest 'limit' any paginated list accepts.
+MAX_PAGE_SIZE = 100
+
+# Upper bound for POST /api/business/promo/{id}/codes?generate=N, generated in one transaction.
+CODE_GENERATE_MAX = 100_000
+
+ACTIVATION_LOG_BATCH_SIZE = 500
+ACTIVATION_LOG_FLUSH_INTERVAL = 2.0
+ACTIVATION_LOG_MAX_ATTEMPTS = 5
+ACTIVATION_LOG_MAX_BACKOFF = 60.0
+
+COUNTER_SHARDS = 8
+COUNTER_FOLD_INTERVAL = 2.0
+COUNTER_FOLD_BATCH_SIZE = 5000
+
+API_FAST_SERIALIZATION = True
+
+# Shared directory for per-worker metric files; None keeps metrics per process.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5.0
+# /api/metrics answers requests that carry "Authorization: Bearer <METRICS_TOKEN>" or come from these addresses.
+METRICS_TOKEN = None
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
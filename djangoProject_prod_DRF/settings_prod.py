@@ -0,0 +1,69 @@
+# Production profile: DJANGO_SETTINGS_MODULE=djangoProject_prod_DRF.settings_prod (wsgi.py and asgi.py alike)
+
+import os
+from importlib.util import find_spec
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'django_DRF'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # Checked on checkout from the pool, or before reusing a persistent connection.
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+if find_spec('psycopg_pool') is None:
+    # psycopg2 has no pool support in Django: keep one connection per worker thread instead.
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+else:
+    # One pool per worker process, shared by its threads (WSGI) or sync_to_async executors (ASGI).
+    # Size it so that workers * DB_POOL_MAX_SIZE stays below Postgres max_connections.
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+            'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+        },
+    }
+
+# Comma-separated read replica hosts, e.g. DB_REPLICA_HOSTS=pg-replica-1,pg-replica-2
+for index, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = dict(DATABASES['default'], HOST=host.strip())
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+
+# Promo payloads, ETag versions, replica pins and token status are shared by every worker, so
+# production needs one cache for all of them; a per-process LocMemCache would serve stale data.
+# Redis sizes the cache itself: run it with e.g. --maxmemory 256mb --maxmemory-policy allkeys-lru.
+REDIS_URL = os.environ.get('REDIS_URL')
+if not REDIS_URL:
+    raise ImproperlyConfigured("settings_prod needs REDIS_URL, e.g. redis://cache:6379/0")
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'promo'),
+        'OPTIONS': {
+            # Connections per worker process.
+            'max_connections': int(os.environ.get('REDIS_MAX_CONNECTIONS', 20)),
+            'socket_timeout': float(os.environ.get('REDIS_SOCKET_TIMEOUT', 1.0)),
+        },
+    }
+}
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Comma-separated scraper addresses; empty means the token is the only way in.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()]